@@ -1,21 +1,28 @@
 # Deployed by:
 # uvicorn app:app --reload --host 0.0.0.0 --port 9001
+# or, with several workers sharing one directory watcher (see event_bus.py):
+# python event_bus.py unix:///tmp/ordmempool.sock
+# ORDMEMPOOL_BUS=unix:///tmp/ordmempool.sock uvicorn app:app --workers 4 --host 0.0.0.0 --port 9001
 
 from __future__ import annotations
 
 import asyncio
-import json
-import os
+import time
 from operator import itemgetter
 from pathlib import Path
 
 from fastapi import FastAPI, HTTPException, Request, WebSocket  # type: ignore
-from fastapi.responses import HTMLResponse, JSONResponse  # type: ignore
+from fastapi.responses import FileResponse, HTMLResponse, Response  # type: ignore
 from fastapi.staticfiles import StaticFiles  # type: ignore
-from watchdog.events import FileSystemEventHandler  # type: ignore
-from watchdog.observers.polling import PollingObserver  # type: ignore
 
+from archive import timeline
+from event_bus import BUS_URL, subscribe, watch_pictures_dir
 from logger import get_logger
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from metrics import WS_CLIENTS, WS_SEND_SECONDS, render_metrics
+from serialization import JSONDecodeError, dumps, dumps_text, loads
+from stats import MempoolStats
+from subscriptions import Predicate, Subscription, compile_filter, filter_from_query
 
 HERE = Path(__file__).parent
 
@@ -27,9 +34,27 @@ app = FastAPI()
 app.mount("/static", StaticFiles(directory="static"), name="static")
 PICTURES_PATH = Path("static/pictures")
 
-connected_clients = set()
+connected_clients: dict[WebSocket, Subscription] = {}
+stats_clients = set()
+# The event loop only keeps weak references to tasks
+background_tasks = set()
+
+stats = MempoolStats()
+STATS_INTERVAL = 5  # seconds between pushes on the stats channel
 
 RESULT_NUM = 20
+# How many of the latest images are looked at to fill RESULT_NUM filtered ones
+FILTER_SCAN_NUM = 2000
+
+# Payloads never change for a given tx_id, so let browsers and proxies keep them
+PAYLOAD_HEADERS = {
+    "Cache-Control": "public, max-age=31536000, immutable",
+    # The content type comes from the inscription, do not let it run scripts
+    "Content-Security-Policy": "sandbox",
+    "X-Content-Type-Options": "nosniff",
+}
+
+HISTORY_MAX_RANGE = 31 * 24 * 60 * 60  # seconds
 
 
 def get_request_port(request: Request) -> int:
@@ -46,7 +71,13 @@ def get_client_ip(request: Request) -> str:
 port = 0
 
 
-def get_mempool_size() -> int:
+def json_response(content) -> Response:
+    return Response(content=dumps(content), media_type="application/json")
+
+
+def count_stored_files() -> int:
+    # Only used once at startup to seed `stats.size`, afterwards the size
+    # is kept up to date from the new/deleted events
     size = 0
     for _ in PICTURES_PATH.glob("*.json"):
         size += 1
@@ -63,71 +94,84 @@ async def read_index(request: Request):
     return index_html
 
 
-async def start_check_for_new_images(path: str):
-    loop = asyncio.get_event_loop()
-    loop.create_task(check_for_new_images(path))
+async def broadcast_event(event: dict) -> None:
+    """Sends a new_tx/tx_deleted event from the bus (or local watcher) to our clients."""
+    try:
+        if event["type"] == "new_tx":
+            for item in event["payload"]:
+                logger.info(f"{port} - New result - {item['image']}")
+                stats.record_new(item["data"])
+        elif event["type"] == "tx_deleted":
+            logger.info(f"Deletion - {event['payload']}")
+            stats.record_deleted()
+        # serialized once for all the clients with the same filter
+        results: dict[str, tuple[str | None, list[str]]] = {}
+        deleted_result = ""
+        if event["type"] == "tx_deleted":
+            deleted_result = dumps_text({**event, "size": stats.size})
+
+        for client, subscription in list(connected_clients.items()):
+            if event["type"] == "new_tx":
+                if subscription.key not in results:
+                    results[subscription.key] = filtered_new_tx(event, subscription)
+                result, tx_ids = results[subscription.key]
+                if result is None:
+                    continue
+                subscription.remember(tx_ids)
+            elif subscription.wants_deleted(event["payload"]):
+                result = deleted_result
+            else:
+                continue
+            start = time.perf_counter()
+            try:
+                await client.send_text(result)
+            except Exception as e:
+                logger.error(f"{port} - Exception broadcast_event - {e}")
+                continue
+            WS_SEND_SECONDS.observe(time.perf_counter() - start, type=event["type"])
+
+        if event["type"] == "new_tx":
+            for item in event["payload"]:
+                stats.record_broadcast(item["data"])
+    except Exception as e:
+        logger.exception(f"{port} - Exception broadcast_event - {e}")
 
 
-class NewJsonFileHandler(FileSystemEventHandler):
-    def on_created(self, event) -> None:
-        if event.is_directory:
-            return
-        new_file_path = event.src_path
-        file_name, file_ext = os.path.splitext(os.path.basename(new_file_path))
+def filtered_new_tx(
+    event: dict, subscription: Subscription
+) -> tuple[str | None, list[str]]:
+    """Serialized `new_tx` with the items the client wants, and their tx_ids."""
+    items = subscription.select(event["payload"])
+    if not items:
+        return None, []
+    result = dumps_text({**event, "payload": items, "size": stats.size})
+    return result, [item["data"].get("tx_id", "") for item in items]
 
-        if file_ext == ".json":
-            # need to call async function from sync function
-            asyncio.run(send_new_result_to_clients(new_file_path))
 
-    def on_deleted(self, event):
-        if event.is_directory:
-            return
-        new_file_path = event.src_path
-        file_name, file_ext = os.path.splitext(os.path.basename(new_file_path))
+def handle_client_message(subscription: Subscription, text: str) -> dict:
+    try:
+        message = loads(text)
+        if not isinstance(message, dict) or message.get("type") != "subscribe":
+            raise ValueError("Only subscribe messages are supported")
+        normalized = subscription.update(message.get("filter") or {})
+    except (JSONDecodeError, ValueError) as e:
+        return {"type": "error", "message": str(e)}
+    return {"type": "subscribed", "filter": normalized}
 
-        if file_ext == ".json":
-            asyncio.run(send_deletions_to_clients(new_file_path))
 
+async def consume_bus_events(bus_url: str) -> None:
+    async for event in subscribe(bus_url):
+        await broadcast_event(event)
 
-async def send_deletions_to_clients(json_file_path: str) -> None:
-    tx_id = Path(json_file_path).name.split(".")[0]
-    logger.info(f"Deletion - {tx_id}")
-    result = {
-        "type": "tx_deleted",
-        "payload": tx_id,
-        "size": get_mempool_size(),
-    }
-    for client in connected_clients:
-        await client.send_json(result)
 
+def start_local_watcher(path: str) -> None:
+    loop = asyncio.get_running_loop()
 
-async def send_new_result_to_clients(json_file_path: str) -> None:
-    try:
-        logger.info(f"{port} - New result - {json_file_path}")
-        data = json.loads(Path(json_file_path).read_text())
-        creation_time = os.path.getmtime(json_file_path)
-        # image has the same name as json file, so delete .json from the end
-        image = Path(json_file_path[: -len(".json")]).name
-        # clients expect a list
-        result = [{"image": image, "data": data, "creation_time": creation_time}]
+    def on_event(event: dict) -> None:
+        # called from the observer thread, websockets belong to our loop
+        asyncio.run_coroutine_threadsafe(broadcast_event(event), loop)
 
-        result = {
-            "type": "new_tx",
-            "payload": result,
-            "size": get_mempool_size(),
-        }
-
-        for client in connected_clients:
-            await client.send_json(result)
-    except Exception as e:
-        logger.exception(f"{port} - Exception send_new_result_to_clients - {e}")
-
-
-async def check_for_new_images(path: str):
-    event_handler = NewJsonFileHandler()
-    observer = PollingObserver()  # because rsync does not trigger events
-    observer.schedule(event_handler, path, recursive=False)
-    observer.start()
+    watch_pictures_dir(path, on_event)
 
 
 def get_host_ip(websocket: WebSocket) -> str:
@@ -146,7 +190,8 @@ def get_connected_ips() -> list[str]:
 async def websocket_endpoint(websocket: WebSocket):
     try:
         await websocket.accept()
-        connected_clients.add(websocket)
+        connected_clients[websocket] = Subscription()
+        WS_CLIENTS.set(len(connected_clients))
         logger.info(f"{port} - New client connected - HOST: {get_host_ip(websocket)}")
         logger.info(
             f"{port} - connected_clients {len(connected_clients)} - {get_connected_ips()}"
@@ -156,35 +201,149 @@ async def websocket_endpoint(websocket: WebSocket):
         raise HTTPException(status_code=500, detail="Internal server error")
     try:
         while True:
-            await websocket.receive_text()
-            await websocket.send_json({"message": "Hello World"})
+            text = await websocket.receive_text()
+            reply = handle_client_message(connected_clients[websocket], text)
+            await websocket.send_text(dumps_text(reply))
     finally:
-        connected_clients.remove(websocket)
+        connected_clients.pop(websocket)
+        WS_CLIENTS.set(len(connected_clients))
         logger.info(f"{port} - Client disconnected - HOST: {get_host_ip(websocket)}")
         logger.info(
             f"{port} - connected_clients {len(connected_clients)} - {get_connected_ips()}"
         )
 
 
+@app.websocket("/ws/stats")
+async def websocket_stats_endpoint(websocket: WebSocket):
+    await websocket.accept()
+    stats_clients.add(websocket)
+    logger.info(f"{port} - New stats client - HOST: {get_host_ip(websocket)}")
+    try:
+        await websocket.send_text(
+            dumps_text({"type": "stats", "payload": stats.to_dict()})
+        )
+        while True:
+            await websocket.receive_text()
+    finally:
+        stats_clients.remove(websocket)
+        logger.info(f"{port} - Stats client gone - HOST: {get_host_ip(websocket)}")
+
+
+async def push_stats_to_clients() -> None:
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        if not stats_clients:
+            continue
+        result = dumps_text({"type": "stats", "payload": stats.to_dict()})
+        for client in list(stats_clients):
+            try:
+                await client.send_text(result)
+            except Exception as e:
+                logger.error(f"{port} - Exception push_stats_to_clients - {e}")
+
+
+@app.get("/api/stats")
+async def do_stats(request: Request):
+    return json_response(stats.to_dict())
+
+
+@app.get("/metrics")
+async def do_metrics():
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
+def payload_file_and_metadata(image_name: str) -> tuple[Path, dict] | None:
+    if "/" in image_name or image_name.startswith(".") or image_name.endswith(".json"):
+        return None
+    payload_file = PICTURES_PATH / image_name
+    try:
+        data = loads((PICTURES_PATH / f"{image_name}.json").read_bytes())
+    except (OSError, JSONDecodeError):
+        return None
+    return payload_file, data
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in tags or "*" in tags
+
+
+@app.api_route("/payload/{image_name}", methods=["GET", "HEAD"])
+async def do_payload(image_name: str, request: Request):
+    found = await asyncio.to_thread(payload_file_and_metadata, image_name)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    payload_file, data = found
+
+    headers = dict(PAYLOAD_HEADERS)
+    if content_hash := data.get("content_hash"):
+        headers["ETag"] = f'"{content_hash}"'
+        if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+    try:
+        stat_result = await asyncio.to_thread(payload_file.stat)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Not found")
+    # Handles Range requests, and hands the path to the server for
+    # sendfile when it supports the ASGI pathsend extension
+    return FileResponse(
+        payload_file,
+        headers=headers,
+        media_type=data.get("content_type") or None,
+        stat_result=stat_result,
+    )
+
+
 @app.get("/api/latest-images")
 async def do_latest_images(request: Request):
+    try:
+        _normalized, matches = compile_filter(filter_from_query(request.query_params))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
         logger.info(f"{port} - Latest images - HOST: {get_client_ip(request)}")
-        latest_images = latest_images_list(num=RESULT_NUM)
-        result = add_json_data_to_images(latest_images)
+        # Listing the directory and reading the metadata is blocking
+        result = await asyncio.to_thread(latest_images_data, matches, RESULT_NUM)
 
         result = {
             "type": "latest_images",
             "result": result,
-            "size": get_mempool_size(),
+            "size": stats.size,
         }
 
-        return JSONResponse(content=result)
+        return json_response(result)
     except Exception as e:
         logger.exception(f"{port} - Exception do_latest_images - {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@app.get("/api/history")
+async def do_history(
+    start: float | None = None, end: float | None = None, bucket: int = 3600
+):
+    """Wait times and fee rates of mined inscriptions, from the archive."""
+    if end is None:
+        end = time.time()
+    if start is None:
+        start = end - 24 * 60 * 60
+    if not 0 < end - start <= HISTORY_MAX_RANGE or bucket < 60:
+        raise HTTPException(status_code=400, detail="Invalid range or bucket")
+    # Reading the partitions is blocking
+    result = await asyncio.to_thread(timeline, start, end, bucket)
+    return json_response(
+        {
+            "type": "history",
+            "start": start,
+            "end": end,
+            "bucket": bucket,
+            "result": result,
+        }
+    )
+
+
 def latest_images_list(
     num: int | None = None, newer_than: float | None = None
 ) -> list[tuple[str, float]]:
@@ -206,14 +365,30 @@ def latest_images_list(
         raise RuntimeError("Should not happen")
 
 
+def latest_images_data(matches: Predicate | None, num: int) -> list[dict]:
+    """The newest `num` images matching, looking at most at `FILTER_SCAN_NUM`."""
+    if matches is None:
+        return add_json_data_to_images(latest_images_list(num=num))
+    latest_images = latest_images_list(num=FILTER_SCAN_NUM)
+    result: list[dict] = []
+    # Reading the metadata only until there are enough matches
+    for index in range(0, len(latest_images), num):
+        end = index + num
+        batch = add_json_data_to_images(latest_images[index:end])
+        result.extend(item for item in batch if matches(item["data"]))
+        if len(result) >= num:
+            break
+    return result[:num]
+
+
 def add_json_data_to_images(images_paths: list[tuple[str, float]]) -> list[dict]:
     image_data = []
     for image_name, _creation_time in images_paths:
         json_file = PICTURES_PATH / f"{image_name}.json"
         if json_file.exists():
             try:
-                json_data = json.loads(json_file.read_text())
-            except json.decoder.JSONDecodeError as e:
+                json_data = loads(json_file.read_bytes())
+            except JSONDecodeError as e:
                 logger.error(f"{port} - JSONDecodeError - {image_name} - {e}")
                 json_data = {}
             image_data.append(json_data)
@@ -227,6 +402,13 @@ def add_json_data_to_images(images_paths: list[tuple[str, float]]) -> list[dict]
 # Register the event handler for server startup
 @app.on_event("startup")
 async def on_startup():
-    pictures_dir = HERE / "static" / "pictures"
-    logger.info(f"Starting up - watching {pictures_dir}")
-    await start_check_for_new_images(str(pictures_dir))
+    stats.seed_size(count_stored_files())
+    loop = asyncio.get_running_loop()
+    background_tasks.add(loop.create_task(push_stats_to_clients()))
+    if BUS_URL:
+        logger.info(f"Starting up - subscribing to {BUS_URL}")
+        background_tasks.add(loop.create_task(consume_bus_events(BUS_URL)))
+    else:
+        pictures_dir = HERE / "static" / "pictures"
+        logger.info(f"Starting up - watching {pictures_dir}")
+        start_local_watcher(str(pictures_dir))
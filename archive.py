@@ -0,0 +1,202 @@
+"""Append-only archive of the inscriptions that got mined.
+
+One file per UTC day (of the block arrival), made of fixed-size binary
+records, so a time range query only reads the days it covers.
+"""
+
+from __future__ import annotations
+
+import struct
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, Self
+
+HERE = Path(__file__).parent
+
+ARCHIVE_DIR = HERE / "archive"
+
+# tx_id, seen_time, mined_at, block_height, fee_rate, content_length, content_type
+_RECORD = struct.Struct("<32sddIfI24s")
+CONTENT_TYPE_BYTES = 24
+
+
+@dataclass(slots=True)
+class ArchiveRecord:
+    tx_id: str
+    seen_time: float  # when the listener saw the tx
+    mined_at: float  # when the block with it arrived
+    block_height: int
+    fee_rate: float
+    content_length: int
+    content_type: str
+
+    @property
+    def wait(self) -> float:
+        return self.mined_at - self.seen_time
+
+    @classmethod
+    def from_metadata(
+        cls, data: dict, block_height: int, mined_at: float | None = None
+    ) -> Self:
+        """From the sidecar JSON written by mempool_ord.py.
+
+        Raises `ValueError` when it does not make a valid record.
+        """
+        try:
+            record = cls(
+                tx_id=data["tx_id"],
+                seen_time=data.get("seen_time") or data.get("timestamp", 0),
+                mined_at=time.time() if mined_at is None else mined_at,
+                block_height=block_height,
+                fee_rate=data.get("fee_rate", 0.0),
+                content_length=data.get("content_length", 0),
+                content_type=data.get("content_type", ""),
+            )
+            # Checks the types and ranges, so a bad file fails here and
+            # not when appending a whole block of records
+            record.pack()
+        except (KeyError, TypeError, AttributeError, ValueError, struct.error) as e:
+            raise ValueError(f"Invalid metadata - {e!r}") from e
+        return record
+
+    def pack(self) -> bytes:
+        return _RECORD.pack(
+            bytes.fromhex(self.tx_id),
+            self.seen_time,
+            self.mined_at,
+            self.block_height,
+            self.fee_rate,
+            self.content_length,
+            self.content_type.encode()[:CONTENT_TYPE_BYTES],
+        )
+
+    @classmethod
+    def unpack(cls, fields: tuple) -> Self:
+        tx_id, seen_time, mined_at, height, fee_rate, length, content_type = fields
+        return cls(
+            tx_id=tx_id.hex(),
+            seen_time=seen_time,
+            mined_at=mined_at,
+            block_height=height,
+            fee_rate=fee_rate,
+            content_length=length,
+            content_type=content_type.rstrip(b"\0").decode(errors="replace"),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "tx_id": self.tx_id,
+            "seen_time": self.seen_time,
+            "mined_at": self.mined_at,
+            "block_height": self.block_height,
+            "wait": self.wait,
+            "fee_rate": self.fee_rate,
+            "content_length": self.content_length,
+            "content_type": self.content_type,
+        }
+
+
+def partition_path(timestamp: float, archive_dir: Path = ARCHIVE_DIR) -> Path:
+    day = datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d")
+    return archive_dir / f"{day}.bin"
+
+
+def _archived(path: Path, block_heights: set[int]) -> set[tuple[bytes, int]]:
+    """(tx_id, block_height) of the records already there from these blocks."""
+    if not path.exists():
+        return set()
+    data = path.read_bytes()
+    usable = len(data) - len(data) % _RECORD.size
+    return {
+        (fields[0], fields[3])
+        for fields in _RECORD.iter_unpack(memoryview(data)[:usable])
+        if fields[3] in block_heights
+    }
+
+
+def append_records(
+    records: Iterable[ArchiveRecord], archive_dir: Path = ARCHIVE_DIR
+) -> int:
+    """Appends the records not archived yet, returns how many.
+
+    A tx is archived once per block, so appending a block again after a
+    failure (or at startup, see `reconcile.py`) does not duplicate it.
+    """
+    by_partition: dict[Path, list[ArchiveRecord]] = {}
+    for record in records:
+        path = partition_path(record.mined_at, archive_dir)
+        by_partition.setdefault(path, []).append(record)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    appended = 0
+    for path, partition_records in by_partition.items():
+        block_heights = {record.block_height for record in partition_records}
+        archived = _archived(path, block_heights)
+        packed = [
+            record.pack()
+            for record in partition_records
+            if (bytes.fromhex(record.tx_id), record.block_height) not in archived
+        ]
+        if not packed:
+            continue
+        # Whole records in one write, so a reader never sees half of one
+        with open(path, "ab") as f:
+            f.write(b"".join(packed))
+        appended += len(packed)
+    return appended
+
+
+def partitions_between(
+    start: float, end: float, archive_dir: Path = ARCHIVE_DIR
+) -> list[Path]:
+    day = datetime.fromtimestamp(start, tz=timezone.utc).date()
+    last_day = datetime.fromtimestamp(end, tz=timezone.utc).date()
+    paths = []
+    while day <= last_day:
+        path = archive_dir / f"{day.isoformat()}.bin"
+        if path.exists():
+            paths.append(path)
+        day += timedelta(days=1)
+    return paths
+
+
+def query(
+    start: float, end: float, archive_dir: Path = ARCHIVE_DIR
+) -> Iterator[ArchiveRecord]:
+    """Records of inscriptions mined between `start` and `end`."""
+    for path in partitions_between(start, end, archive_dir):
+        data = path.read_bytes()
+        # A writer could be in the middle of appending
+        usable = len(data) - len(data) % _RECORD.size
+        for fields in _RECORD.iter_unpack(memoryview(data)[:usable]):
+            if start <= fields[2] < end:
+                yield ArchiveRecord.unpack(fields)
+
+
+def timeline(
+    start: float, end: float, bucket: int, archive_dir: Path = ARCHIVE_DIR
+) -> list[dict]:
+    """Per time bucket counts, wait times and fee rates, for charts."""
+    buckets: dict[int, list[ArchiveRecord]] = {}
+    for record in query(start, end, archive_dir):
+        key = int(record.mined_at - start) // bucket
+        buckets.setdefault(key, []).append(record)
+
+    result = []
+    for key in sorted(buckets):
+        records = buckets[key]
+        waits = sorted(record.wait for record in records)
+        fee_rates = sorted(record.fee_rate for record in records)
+        result.append(
+            {
+                "start": start + key * bucket,
+                "count": len(records),
+                "bytes": sum(record.content_length for record in records),
+                "wait_median": waits[len(waits) // 2],
+                "wait_max": waits[-1],
+                "fee_rate_median": fee_rates[len(fee_rates) // 2],
+                "fee_rate_min": fee_rates[0],
+            }
+        )
+    return result
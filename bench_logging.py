@@ -0,0 +1,84 @@
+"""Listener throughput with the different logging modes.
+
+Replays synthetic ZMQ `sequence` messages through the same parsing and
+logging that `mempool_listen.yield_new_tx_ids` does, without a node.
+
+    python bench_logging.py [number_of_messages]
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from logger import SAMPLED, get_logger
+
+MODES: dict[str, dict] = {
+    "off": {},
+    "sync": {"use_queue": False},
+    "sync_sampled": {"use_queue": False, "sample_every": 100},
+    "async": {"use_queue": True},
+    "async_sampled": {"use_queue": True, "sample_every": 100},
+    "async_json": {"use_queue": True, "json_format": True},
+}
+
+
+def sequence_messages(count: int) -> list[bytes]:
+    messages = []
+    for i in range(count):
+        tx_id = os.urandom(32)
+        label = b"A" if i % 2 == 0 else b"R"
+        messages.append(tx_id + label + i.to_bytes(8, "little"))
+    return messages
+
+
+def run_listener_loop(messages: list[bytes], logger: logging.Logger | None) -> int:
+    yielded = 0
+    for data in messages:
+        if len(data) == 41:
+            tx_id = data[:32].hex()
+            added_or_deleted = chr(data[32])
+            if logger is not None:
+                logger.info("%s %s", tx_id, added_or_deleted, extra=SAMPLED)
+            if added_or_deleted == "A":
+                yielded += 1
+    return yielded
+
+
+def bench_mode(mode: str, messages: list[bytes], log_dir: Path) -> tuple[float, float]:
+    logger = None
+    if mode != "off":
+        logger = get_logger(f"bench_{mode}", log_dir / f"{mode}.log", **MODES[mode])
+    start = time.perf_counter()
+    run_listener_loop(messages, logger)
+    loop_time = time.perf_counter() - start
+    if logger is not None:
+        # Wait for the queue to be drained, to also see the total cost
+        for handler in logger.handlers:
+            if hasattr(handler, "queue"):
+                while not handler.queue.empty():
+                    time.sleep(0.001)
+            handler.flush()
+    total_time = time.perf_counter() - start
+    return loop_time, total_time
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    messages = sequence_messages(count)
+    print(f"{count} sequence messages")
+    print(f"{'mode':<15} {'msgs/sec':>12} {'drained msgs/sec':>18}")
+    with tempfile.TemporaryDirectory() as log_dir:
+        for mode in MODES:
+            loop_time, total_time = bench_mode(mode, messages, Path(log_dir))
+            print(
+                f"{mode:<15} {count / loop_time:>12,.0f} {count / total_time:>18,.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
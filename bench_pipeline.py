@@ -0,0 +1,213 @@
+"""Throughput and latency of the mempool_listen -> mempool_ord pipeline.
+
+Replays a recording (see `recording.py`) through `fake_bitcoind.py` and runs
+each pipeline configuration in its own process, so peak RSS is per config.
+
+    python bench_pipeline.py recording.bin.gz [--speed 0]
+    python bench_pipeline.py --synthetic 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+HERE = Path(__file__).parent
+
+# What is done with every new tx
+CONFIGS = {
+    "txs": "fetch and decode the tx (mempool_listen.yield_new_txs)",
+    "ordinals": "+ parse the inscription",
+    "ord_files": "+ mempool_ord.process_image_ordinal into a temp dir",
+}
+
+IDLE_TIMEOUT_MS = 2000
+
+
+def _percentile(values: list[float], p: int) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * p // 100)]
+
+
+def write_synthetic_recording(path: str | Path, count: int) -> None:
+    """Recording of `count` txs, every third one an image inscription.
+
+    Every tx spends an already mined output, so the fee calculation
+    goes through the same RPC calls as for the real mempool.
+    """
+    from recording import RecordingWriter
+
+    writer = RecordingWriter(path)
+    now = time.time()
+    block_hash = "00" * 32
+    writer.write_rpc("getblock", [block_hash], {"height": 800_000, "time": int(now)})
+    for i in range(count):
+        timestamp = now + i / 500  # recorded at 500 txs/sec
+        tx_id = hashlib.sha256(f"tx{i}".encode()).hexdigest()
+        prev_tx_id = hashlib.sha256(f"prev{i}".encode()).hexdigest()
+        is_inscription = i % 3 == 0
+        if is_inscription:
+            payload = hashlib.sha256(str(i).encode()).digest() * 64
+            script = "20" + "ab" * 32 + "ac0063036f7264" + payload.hex() + "68"
+            chunks = [payload[j:][:520].hex() for j in range(0, len(payload), 520)]
+            asm = " ".join(
+                ["ab" * 32, "OP_CHECKSIG", "0", "OP_IF", "6582895", "1"]
+                + ["image/png".encode().hex(), "0"]
+                + chunks
+                + ["OP_ENDIF"]
+            )
+        else:
+            script = "02" + "cd" * 32
+            asm = "02" + "cd" * 32
+        vin = [{"txid": prev_tx_id, "vout": 0, "txinwitness": ["30" * 36, script]}]
+        vout = [{"value": 0.00000546, "scriptPubKey": {"address": f"bc1q{i}"}}]
+        for txid, raw, vin_, vout_, size in (
+            (tx_id, f"raw{tx_id}", vin, vout, 200 + len(script) // 2),
+            (prev_tx_id, f"raw{prev_tx_id}", [], [{"value": 0.0001}], 150),
+        ):
+            decoded = {"txid": txid, "size": size, "vsize": size // 2}
+            decoded.update({"vin": vin_, "vout": vout_})
+            writer.write_rpc("getrawtransaction", [txid], raw, timestamp=timestamp)
+            writer.write_rpc("decoderawtransaction", [raw], decoded)
+        writer.write_rpc("getrawtransaction", [tx_id, True], {"txid": tx_id})
+        writer.write_rpc(
+            "getrawtransaction",
+            [prev_tx_id, True],
+            {"txid": prev_tx_id, "blockhash": block_hash},
+        )
+        writer.write_rpc("decodescript", [script], {"asm": asm})
+        sequence = bytes.fromhex(tx_id) + b"A" + i.to_bytes(8, "little")
+        writer.write_zmq([b"sequence", sequence, i.to_bytes(4, "little")], timestamp)
+    writer.close()
+
+
+def run_config(config: str, recording_path: str, speed: float) -> dict:
+    """Runs in the child process."""
+    import zmq
+
+    from fake_bitcoind import ZMQ_ENDPOINTS, FakeBitcoind
+
+    fake = FakeBitcoind(recording_path, speed=speed)
+    fake.start_rpc()
+    os.environ["ORDMEMPOOL_RPC_URL"] = fake.rpc_url
+    os.environ["ORDMEMPOOL_ZMQ_SEQUENCE"] = ZMQ_ENDPOINTS[b"sequence"]
+
+    import mempool_listen
+    import mempool_ord
+    import storage
+
+    mempool_listen.zmq_socket.setsockopt(zmq.RCVTIMEO, IDLE_TIMEOUT_MS)
+    tmp_dir = tempfile.TemporaryDirectory()
+    mempool_ord.data_dir = Path(tmp_dir.name)
+    # Renames into data_dir need the staging dir on the same filesystem
+    storage.STAGING_DIR = Path(tmp_dir.name) / "staging"
+    storage.JOURNAL_DIR = storage.STAGING_DIR / "journal"
+    conn = mempool_listen.conn
+
+    replay_thread = threading.Thread(target=fake.replay, daemon=True)
+    replay_thread.start()
+
+    txs = 0
+    inscriptions = 0
+    latencies = []
+    first = last = 0.0
+    try:
+        for tx in mempool_listen.yield_new_txs():
+            if config != "txs":
+                inscription = tx.get_inscription(conn)
+                if inscription is not None:
+                    inscriptions += 1
+                    if config == "ord_files":
+                        mempool_ord.process_image_ordinal(inscription, tx, conn)
+            last = time.time()
+            txs += 1
+            if tx.tx_id in fake.sent_times:
+                if not first:
+                    first = fake.sent_times[tx.tx_id]
+                latencies.append(last - fake.sent_times[tx.tx_id])
+    except zmq.Again:
+        pass
+    fake.close()
+    tmp_dir.cleanup()
+
+    elapsed = last - first if txs else 0.0
+    return {
+        "config": config,
+        "txs": txs,
+        "inscriptions": inscriptions if config != "txs" else None,
+        "txs_per_sec": txs / elapsed if elapsed else None,
+        "inscriptions_per_sec": (
+            inscriptions / elapsed if elapsed and config != "txs" else None
+        ),
+        "latency_p50": _percentile(latencies, 50),
+        "latency_p90": _percentile(latencies, 90),
+        "latency_p99": _percentile(latencies, 99),
+        # kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def _fmt(value: float | None, spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recording", nargs="?")
+    parser.add_argument("--synthetic", type=int, help="generate N txs instead")
+    parser.add_argument("--speed", type=float, default=0.0, help="0 = max speed")
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS))
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_config(args.child, args.recording, args.speed)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        recording = args.recording
+        if args.synthetic:
+            recording = str(Path(tmp) / "synthetic.bin.gz")
+            write_synthetic_recording(recording, args.synthetic)
+        if recording is None:
+            parser.error("either a recording or --synthetic is needed")
+
+        print(
+            f"{'config':<10} {'txs':>6} {'txs/s':>9} {'ins/s':>9} "
+            f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'RSS MB':>7}"
+        )
+        for config in args.configs:
+            output = subprocess.run(
+                [sys.executable, __file__, recording, "--speed", str(args.speed)]
+                + ["--child", config],
+                cwd=HERE,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            r = json.loads(output.strip().splitlines()[-1])
+            latencies = [
+                None if r[k] is None else r[k] * 1000
+                for k in ("latency_p50", "latency_p90", "latency_p99")
+            ]
+            print(
+                f"{config:<10} {r['txs']:>6} {_fmt(r['txs_per_sec'], ',.0f'):>9} "
+                f"{_fmt(r['inscriptions_per_sec'], ',.0f'):>9} "
+                + " ".join(f"{_fmt(v, '.2f'):>8}" for v in latencies)
+                + f" {r['peak_rss_mb']:>7.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""JSON serialization of the sidecar metadata and websocket payloads.
+
+Compares the previous json.dump(indent=1) with `serialization.dumps`,
+and serializing a broadcast per client with serializing it once.
+
+    python bench_serialization.py [number_of_clients]
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import time
+from decimal import Decimal
+
+import serialization
+
+REPEAT = 200
+
+
+class DecimalEncoder(json.JSONEncoder):
+    # What mempool_ord.py used before
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return str(obj)
+        return super().default(obj)
+
+
+def metadata(outputs: int) -> dict:
+    """Sidecar JSON as written by mempool_ord.process_image_ordinal."""
+    return {
+        "tx_id": "ab" * 32,
+        "block": None,
+        "size": 600 + 43 * outputs,
+        "vsize": 300 + 43 * outputs,
+        "vin": [{"tx_id": "cd" * 32, "vout": 0}],
+        "vout": [
+            {"address": f"bc1p{n:058d}", "value": 546, "script": "5120" + "ef" * 32}
+            for n in range(outputs)
+        ],
+        "seen_time": 1697000000.123,
+        "fee": 12345,
+        "fee_rate": 41.15,
+        "total_input": 100000,
+        "total_output": 87655,
+        "content_type": "image/png",
+        "content_hash": "0123456789abcdef0123456789abcdef",
+        "content_length": 10240,
+        "timestamp": 1697000001,
+        "datetime": "2023-10-11 04:53:21 UTC",
+    }
+
+
+def timed(func, *args) -> float:
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        func(*args)
+    return (time.perf_counter() - start) / REPEAT
+
+
+def main() -> None:
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    backend = "orjson" if serialization.orjson is not None else "json"
+    print(f"serialization backend: {backend}, {clients} websocket clients")
+    print(f"{'payload':<18} {'encoder':<22} {'bytes':>9} {'us/dump':>9} {'us/load':>9}")
+    encoders = {
+        "json indent=1": lambda d: json.dumps(d, indent=1, cls=DecimalEncoder),
+        "json compact": lambda d: json.dumps(d, separators=(",", ":")),
+        "serialization.dumps": serialization.dumps,
+    }
+    for outputs in (2, 1000):
+        data = metadata(outputs)
+        for name, encoder in encoders.items():
+            encoded = encoder(data)
+            dump_time = timed(encoder, data)
+            load_time = timed(serialization.loads, encoded)
+            print(
+                f"{f'metadata {outputs} out':<18} {name:<22} {len(encoded):>9,} "
+                f"{dump_time * 1e6:>9,.1f} {load_time * 1e6:>9,.1f}"
+            )
+
+    # The new_tx broadcast - before, send_json serialized it for every client
+    event = {
+        "type": "new_tx",
+        "payload": [{"image": "x.png", "data": metadata(2), "creation_time": 1.0}],
+        "size": 1234,
+    }
+    per_client = timed(lambda e: [json.dumps(e) for _ in range(clients)], event)
+    once = timed(serialization.dumps_text, event)
+    print(
+        f"new_tx broadcast: {per_client * 1e3:.2f} ms serializing per client, "
+        f"{once * 1e3:.3f} ms serializing once"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""Memory and serialization speed of the Tx/Input/Output records.
+
+Compares the current slotted records in `common.py` with the previous
+dict-wrapping ones on large batch-mint transactions, and on the plain
+(non-inscription) ones that make up almost all of the mempool.
+
+    python bench_tx.py [number_of_txs] [outputs_per_tx]
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from decimal import Decimal
+
+from common import BTC_SATOSHI, BasicBlock, Tx
+
+WITNESS_BYTES = 350_000
+ROUNDS = 5
+
+
+class StubConn:
+    """Answers the RPC calls Tx needs from already decoded transactions."""
+
+    def __init__(self) -> None:
+        self.decoded: dict[str, dict] = {}
+
+    def getrawtransaction(self, tx_id: str, verbose: bool = False):
+        if verbose:
+            return {"txid": tx_id}  # no blockhash, still in the mempool
+        return f"raw{tx_id}"
+
+    def decoderawtransaction(self, raw_tx: str) -> dict:
+        return self.decoded[raw_tx.removeprefix("raw")]
+
+
+def batch_mint(index: int, outputs: int) -> dict:
+    """Decoded reveal tx with one huge witness and many outputs."""
+    return {
+        "txid": f"{index:064x}",
+        "hash": f"{index:064x}",
+        "version": 2,
+        "size": WITNESS_BYTES + 43 * outputs,
+        "vsize": WITNESS_BYTES // 4 + 43 * outputs,
+        "weight": WITNESS_BYTES + 172 * outputs,
+        "locktime": 0,
+        "vin": [
+            {
+                "txid": "ab" * 32,
+                "vout": 0,
+                "scriptSig": {"asm": "", "hex": ""},
+                "txinwitness": [
+                    "cd" * 64,
+                    # key, OP_CHECKSIG, OP_FALSE, OP_IF, "ord", ...
+                    "20"
+                    + "ef" * 32
+                    + "ac0063036f7264"
+                    + f"{index:08x}" * (WITNESS_BYTES // 4),
+                ],
+                "sequence": 4294967293,
+            }
+        ],
+        "vout": [
+            {
+                "value": Decimal("0.00000546"),
+                "n": n,
+                "scriptPubKey": {
+                    "asm": "1 " + "ef" * 32,
+                    "desc": f"rawtr({'ef' * 32})#abcdefgh",
+                    "hex": "5120" + "ef" * 32,
+                    "address": f"bc1p{n:058d}",
+                    "type": "witness_v1_taproot",
+                },
+            }
+            for n in range(outputs)
+        ],
+    }
+
+
+def plain_tx(index: int, outputs: int = 2) -> dict:
+    """Decoded taproot key-path spend."""
+    tx = batch_mint(index, outputs)
+    tx["size"] = tx["vsize"] = 150 + 43 * outputs
+    tx["vin"][0]["txinwitness"] = ["cd" * 64]
+    return tx
+
+
+def funding_tx() -> dict:
+    return {
+        "txid": "ab" * 32,
+        "size": 200,
+        "vsize": 150,
+        "vin": [],
+        "vout": [{"value": Decimal("1.0"), "scriptPubKey": {"hex": "00"}}],
+    }
+
+
+# The previous records, wrapping the whole decoded dict
+@dataclass
+class LegacyInput:
+    _d: dict
+
+    @property
+    def tx_id(self) -> str:
+        return self._d["txid"]
+
+    @property
+    def vout(self) -> int:
+        return self._d["vout"]
+
+
+@dataclass
+class LegacyOutput:
+    _d: dict
+
+    @property
+    def value(self) -> int:
+        return int(BTC_SATOSHI * self._d["value"])
+
+
+@dataclass
+class LegacyTx:
+    tx_id: str
+    block: BasicBlock | None
+    size: int
+    vsize: int
+    vin: list[LegacyInput]
+    vout: list[LegacyOutput]
+
+    @classmethod
+    def from_tx_id(cls, tx_id: str, conn: StubConn) -> LegacyTx:
+        tx = conn.decoderawtransaction(conn.getrawtransaction(tx_id))
+        return cls(
+            tx_id=tx["txid"],
+            block=BasicBlock.from_tx_id(tx["txid"], conn),
+            size=tx["size"],
+            vsize=tx["vsize"],
+            vin=[LegacyInput(vin) for vin in tx["vin"]],
+            vout=[LegacyOutput(vout) for vout in tx["vout"]],
+        )
+
+    def total_input(self, conn: StubConn) -> int:
+        total_input = 0
+        for vin in self.vin:
+            input_tx = LegacyTx.from_tx_id(vin.tx_id, conn)
+            total_input += input_tx.vout[vin.vout].value
+        return total_input
+
+    def total_output(self) -> int:
+        return sum([vout.value for vout in self.vout])
+
+    def fee(self, conn: StubConn) -> int:
+        return self.total_input(conn) - self.total_output()
+
+    def to_dict_without_witness(self, conn: StubConn) -> dict:
+        res = asdict(self, dict_factory=dict)
+        res["fee"] = self.fee(conn)
+        res["fee_rate"] = self.fee(conn) / self.vsize
+        res["total_input"] = self.total_input(conn)
+        res["total_output"] = self.total_output()
+        for vin in res["vin"]:
+            vin["_d"].pop("txinwitness")
+        return res
+
+
+def parse_txs(tx_cls, conn: StubConn, decoded: list[dict]) -> list:
+    txs = []
+    for tx in decoded:
+        conn.decoded[tx["txid"]] = tx
+        txs.append(tx_cls.from_tx_id(tx["txid"], conn))
+        del conn.decoded[tx["txid"]]
+    return txs
+
+
+def bench(tx_cls, make_tx, count: int, outputs: int) -> tuple[float, float, float]:
+    conn = StubConn()
+    conn.decoded["ab" * 32] = funding_tx()
+
+    # Memory kept by the records once the decoded dicts are gone
+    tracemalloc.start()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    txs = parse_txs(tx_cls, conn, [make_tx(i, outputs) for i in range(count)])
+    retained = tracemalloc.get_traced_memory()[0] - start_memory
+    tracemalloc.stop()
+
+    # tracemalloc slows down allocations, so time without it, best of a few
+    parse_time = float("inf")
+    for _ in range(ROUNDS):
+        decoded = [make_tx(i, outputs) for i in range(count)]
+        start = time.perf_counter()
+        txs = parse_txs(tx_cls, conn, decoded)
+        parse_time = min(parse_time, time.perf_counter() - start)
+        del decoded
+
+    start = time.perf_counter()
+    for tx in txs:
+        tx.to_dict_without_witness(conn)
+    serialize_time = time.perf_counter() - start
+    return retained / count, count / parse_time, count / serialize_time
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    outputs = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    print(
+        f"batch mints: {count} txs, {outputs} outputs, {WITNESS_BYTES} bytes witness"
+        f" each; plain: {count * 100} txs, 2 outputs"
+    )
+    print(
+        f"{'txs':<12} {'records':<10} {'KB per tx':>10} {'parsed/s':>10} "
+        f"{'serialized/s':>13}"
+    )
+    kinds = (
+        ("batch mints", batch_mint, count, outputs),
+        ("plain", plain_tx, count * 100, 2),
+    )
+    for kind, make_tx, kind_count, kind_outputs in kinds:
+        for name, tx_cls in (("legacy", LegacyTx), ("slotted", Tx)):
+            per_tx, parsed, serialized = bench(
+                tx_cls, make_tx, kind_count, kind_outputs
+            )
+            print(
+                f"{kind:<12} {name:<10} {per_tx / 1024:>10,.1f} {parsed:>10,.1f} "
+                f"{serialized:>13,.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,17 @@
 from __future__ import annotations
 
+import os
 import time
 from pathlib import Path
 from typing import Iterator
 
 import zmq
 
+from archive import ArchiveRecord, append_records
 from common import rpc_connection
 from logger import get_logger
+from metrics import BLOCK_DELETED_TXS, ZMQ_MESSAGES, start_metrics_server
+from serialization import JSONDecodeError, loads
 
 HERE = Path(__file__).parent
 
@@ -16,10 +20,12 @@ PICS_DIR = HERE / "static" / "pictures"
 zmq_context = zmq.Context()
 zmq_socket = zmq_context.socket(zmq.SUB)
 zmq_topic = b"hashblock"
-zmq_socket.connect("tcp://127.0.0.1:28334")
+zmq_socket.connect(os.environ.get("ORDMEMPOOL_ZMQ_HASHBLOCK", "tcp://127.0.0.1:28334"))
 zmq_socket.setsockopt(zmq.SUBSCRIBE, zmq_topic)
 conn = rpc_connection()
 
+METRICS_PORT = 9102
+
 log_file_path = HERE / "blocks_listen.log"
 logger = get_logger(__file__, log_file_path)
 
@@ -27,6 +33,7 @@ logger = get_logger(__file__, log_file_path)
 def yield_new_block_hashes() -> Iterator[str]:
     while True:
         _topic, block_hash, _seq_num = zmq_socket.recv_multipart()
+        ZMQ_MESSAGES.inc(topic="hashblock")
         block_hash_str = block_hash.hex()
         yield block_hash_str
 
@@ -45,6 +52,20 @@ def delete_tx_id_from_mempool_dir(tx_id: str) -> None:
         file.unlink()
 
 
+def archive_record(
+    tx_id: str, block_height: int, mined_at: float
+) -> ArchiveRecord | None:
+    for json_file in PICS_DIR.glob(f"{tx_id}.*.json"):
+        try:
+            data = loads(json_file.read_bytes())
+            return ArchiveRecord.from_metadata(data, block_height, mined_at)
+        except (OSError, JSONDecodeError, ValueError):
+            # One bad file must not keep the whole block from being processed
+            logger.exception(f"Cannot archive {json_file}")
+            return None
+    return None
+
+
 def load_all_ords_in_mempool() -> set[str]:
     all_ids = [file.name.split(".")[0] for file in PICS_DIR.glob("*.json")]
     all_ids = set(all_ids)
@@ -57,17 +78,27 @@ def check_all_minted_ordinals_from_mempool():
     block_iter = yield_new_block_hashes()
     while True:
         block_hash = next(block_iter)
+        mined_at = time.time()
         logger.info(f"New block hash: {block_hash}")
         while True:
             try:
                 all_mempool_ids = load_all_ords_in_mempool()
                 logger.info(f"Ords in mempool {len(all_mempool_ids)}")
-                deleted_ids = []
-                all_block_tx_ids = conn.getblock(block_hash)["tx"]
-                for mined_tx_id in all_block_tx_ids:
-                    if mined_tx_id in all_mempool_ids:
-                        delete_tx_id_from_mempool_dir(mined_tx_id)
-                        deleted_ids.append(mined_tx_id)
+                block = conn.getblock(block_hash)
+                all_block_tx_ids = block["tx"]
+                deleted_ids = [
+                    tx_id for tx_id in all_block_tx_ids if tx_id in all_mempool_ids
+                ]
+                records = []
+                for mined_tx_id in deleted_ids:
+                    record = archive_record(mined_tx_id, block["height"], mined_at)
+                    if record is not None:
+                        records.append(record)
+                # Archived before deleting, the metadata is gone afterwards
+                append_records(records)
+                for mined_tx_id in deleted_ids:
+                    delete_tx_id_from_mempool_dir(mined_tx_id)
+                BLOCK_DELETED_TXS.inc(len(deleted_ids))
                 logger.info(f"Block had {len(all_block_tx_ids)} txs")
                 logger.info(f"Deleted {len(deleted_ids)} ids: {deleted_ids}")
                 break
@@ -80,6 +111,7 @@ def check_all_minted_ordinals_from_mempool():
 
 
 if __name__ == "__main__":
+    start_metrics_server(METRICS_PORT)
     while True:
         try:
             check_all_minted_ordinals_from_mempool()
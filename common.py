@@ -1,14 +1,24 @@
 from __future__ import annotations
 
 import hashlib
-from dataclasses import asdict, dataclass
+import os
+import time
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass, field
 from datetime import datetime
+from decimal import Decimal
 from pathlib import Path
 from typing import Self
 
 from bitcoin.rpc import JSONRPCError, RawProxy
 
 from logger import get_logger
+from metrics import (
+    INSCRIPTION_PARSES,
+    METRICS_ENABLED,
+    RPC_CALL_SECONDS,
+    RPC_ERRORS,
+)
 
 HERE = Path(__file__).parent
 
@@ -18,8 +28,32 @@ log_file_path = HERE / "common.log"
 logger = get_logger(__file__, log_file_path)
 
 
+class InstrumentedRawProxy(RawProxy):
+    def _call(self, service_name, *args):
+        start = time.perf_counter()
+        try:
+            return super()._call(service_name, *args)
+        except Exception:
+            RPC_ERRORS.inc(method=service_name)
+            raise
+        finally:
+            RPC_CALL_SECONDS.observe(time.perf_counter() - start, method=service_name)
+
+
 def rpc_connection() -> RawProxy:
-    return RawProxy(service_port=8332, btc_conf_file="mainnet.conf")
+    proxy_cls = InstrumentedRawProxy if METRICS_ENABLED else RawProxy
+    # Points the RPC elsewhere than the local node, e.g. to fake_bitcoind.py
+    rpc_url = os.environ.get("ORDMEMPOOL_RPC_URL")
+    if rpc_url:
+        return proxy_cls(service_url=rpc_url)
+    return proxy_cls(service_port=8332, btc_conf_file="mainnet.conf")
+
+
+def inscription_id_from_push(value_hex: str) -> str:
+    """Parent tag value is the reversed txid and a little-endian index."""
+    value = bytes.fromhex(value_hex)
+    index = int.from_bytes(value[32:], "little")
+    return f"{value[:32][::-1].hex()}i{index}"
 
 
 @dataclass
@@ -28,12 +62,13 @@ class InscriptionContent:
     content_hash: str
     content_length: int
     payload: bytes
+    parents: list[str] = field(default_factory=list)
 
     def __repr__(self) -> str:
         return f"InscriptionContent(content_type={self.content_type}, content_hash={self.content_hash}, content_length={self.content_length})"
 
 
-@dataclass
+@dataclass(slots=True)
 class BasicBlock:
     block_hash: str
     block_height: int
@@ -86,29 +121,31 @@ class BasicBlock:
     def datetime(self) -> str:
         return datetime.fromtimestamp(self.timestamp).strftime("%Y-%m-%d %H:%M:%S")
 
+    def to_dict(self) -> dict:
+        return {
+            "block_hash": self.block_hash,
+            "block_height": self.block_height,
+            "timestamp": self.timestamp,
+        }
 
-@dataclass
+
+@dataclass(slots=True)
 class Input:
-    _d: dict
+    # Taken over from the decoded tx as they are - building a Tx has to be
+    # cheap, almost none of them are inscriptions
+    tx_id: str  # empty for coinbase inputs
+    vout: int
 
     def __repr__(self) -> str:
         return f"Input(tx_id={self.tx_id}, vout={self.vout})"
 
     @classmethod
     def from_dict(cls, d: dict) -> Self:
-        return cls(d)
+        # Positional, called for every input of every mempool tx
+        return cls(d.get("txid", ""), d.get("vout", 0))
 
-    @property
-    def tx_id(self) -> str:
-        return self._d["txid"]
-
-    @property
-    def vout(self) -> int:
-        return self._d["vout"]
-
-    @property
-    def txinwitness(self) -> list[str]:
-        return self._d["txinwitness"]
+    def to_dict(self) -> dict:
+        return {"tx_id": self.tx_id, "vout": self.vout}
 
     def value(self, conn: RawProxy) -> int:
         prev_tx = Tx.from_tx_id(self.tx_id, conn)
@@ -116,34 +153,115 @@ class Input:
         return prev_tx.vout[self.vout].value
 
 
-@dataclass
+@dataclass(slots=True)
 class Output:
-    _d: dict
+    # Converted only when used, see `Input` and `Outputs`
+    amount: Decimal  # BTC
+    script_hex: str
+    address: str
 
     def __repr__(self) -> str:
-        return f"Output(address={self.address}, value={self.value})"
+        return f"Output(address={self.address}, value={self.amount})"
 
     @classmethod
     def from_dict(cls, d: dict) -> Self:
-        return cls(d)
+        script_pub_key = d.get("scriptPubKey", {})
+        return cls(
+            d["value"], script_pub_key.get("hex", ""), script_pub_key.get("address", "")
+        )
 
     @property
-    def address(self) -> str:
-        return self._d.get("scriptPubKey", {}).get("address", "")
+    def value(self) -> int:
+        """In satoshis."""
+        return int(BTC_SATOSHI * self.amount)
 
     @property
-    def value(self) -> int:
-        return int(BTC_SATOSHI * self._d["value"])  # type: ignore
+    def script(self) -> bytes:
+        return bytes.fromhex(self.script_hex)
 
+    def to_dict(self) -> dict:
+        return {
+            "address": self.address,
+            "value": self.value,
+            "script": self.script_hex,
+        }
 
-@dataclass
+
+class Outputs(Sequence[Output]):
+    """The outputs of a tx, stored column-wise.
+
+    Most txs never have their outputs read, and a batch mint has hundreds,
+    so an `Output` is only made for the ones asked for.
+    """
+
+    __slots__ = ("amounts", "script_hexes", "addresses")
+
+    def __init__(
+        self, amounts: list[Decimal], script_hexes: list[str], addresses: list[str]
+    ) -> None:
+        self.amounts = amounts
+        self.script_hexes = script_hexes
+        self.addresses = addresses
+
+    @classmethod
+    def from_dicts(cls, dicts: list[dict]) -> Self:
+        amounts = []
+        script_hexes = []
+        addresses = []
+        for d in dicts:
+            script_pub_key = d.get("scriptPubKey", {})
+            amounts.append(d["value"])
+            script_hexes.append(script_pub_key.get("hex", ""))
+            addresses.append(script_pub_key.get("address", ""))
+        return cls(amounts, script_hexes, addresses)
+
+    def __repr__(self) -> str:
+        return f"Outputs({list(self)})"
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def __getitem__(self, index):  # type: ignore[override]
+        if isinstance(index, slice):
+            return list(self)[index]
+        return Output(
+            self.amounts[index], self.script_hexes[index], self.addresses[index]
+        )
+
+    def __iter__(self) -> Iterator[Output]:
+        for fields in zip(self.amounts, self.script_hexes, self.addresses):
+            yield Output(*fields)
+
+
+# OP_IF, then a push of "ord" starts every inscription envelope
+ENVELOPE_MARKER = "63036f7264"
+
+
+def tapscript_from_vin(vin: list[dict]) -> str:
+    """Second witness item of the first input, if it can hold an inscription.
+
+    Stays hex - the string the node gave us is what `decodescript` takes.
+    """
+    witness = vin[0].get("txinwitness", ()) if vin else ()
+    # Right after the key and OP_CHECKSIG, so do not scan whole witnesses
+    if len(witness) < 2 or witness[1].find(ENVELOPE_MARKER, 0, 1024) == -1:
+        return ""
+    return witness[1]
+
+
+@dataclass(slots=True)
 class Tx:
     tx_id: str
     block: BasicBlock | None
     size: int
     vsize: int
     vin: list[Input]
-    vout: list[Output]
+    vout: Sequence[Output]
+    # When the tx was first announced to us over ZMQ (0.0 if unknown)
+    seen_time: float = 0.0
+    # The only part of the witness we need - where an inscription would be,
+    # kept out of the repr, as that is logged for every tx
+    tapscript_hex: str = field(default="", repr=False)
 
     @classmethod
     def from_tx_id(cls, tx_id: str, conn: RawProxy) -> Self | None:
@@ -163,13 +281,16 @@ class Tx:
             logger.error(f"Exception Tx::from_raw_tx_data  {raw_tx} : {e}")
             return None
 
+        # Positional, called for every mempool tx
         return cls(
-            tx_id=tx["txid"],
-            block=BasicBlock.from_tx_id(tx["txid"], conn),
-            size=tx["size"],
-            vsize=tx["vsize"],
-            vin=[Input.from_dict(vin) for vin in tx["vin"]],
-            vout=[Output.from_dict(vout) for vout in tx["vout"]],
+            tx["txid"],
+            BasicBlock.from_tx_id(tx["txid"], conn),
+            tx["size"],
+            tx["vsize"],
+            [Input.from_dict(vin) for vin in tx["vin"]],
+            Outputs.from_dicts(tx["vout"]),
+            0.0,  # seen_time, set by the caller
+            tapscript_from_vin(tx["vin"]),
         )
 
     def fee(self, conn: RawProxy) -> int:
@@ -190,21 +311,31 @@ class Tx:
         return sum([vout.value for vout in self.vout])
 
     def to_dict_without_witness(self, conn: RawProxy) -> dict:
-        res = asdict(self, dict_factory=dict)
-        res["fee"] = self.fee(conn)
-        res["fee_rate"] = self.fee_rate(conn)
-        res["total_input"] = self.total_input(conn)
-        res["total_output"] = self.total_output()
-        for vin in res["vin"]:
-            vin["_d"].pop("txinwitness")
-        return res
-
-
-@dataclass
+        # Fetching the inputs is the expensive part, so only once
+        total_input = self.total_input(conn)
+        total_output = self.total_output()
+        fee = total_input - total_output
+        return {
+            "tx_id": self.tx_id,
+            "block": None if self.block is None else self.block.to_dict(),
+            "size": self.size,
+            "vsize": self.vsize,
+            "vin": [vin.to_dict() for vin in self.vin],
+            "vout": [vout.to_dict() for vout in self.vout],
+            "seen_time": self.seen_time,
+            "fee": fee,
+            "fee_rate": fee / self.vsize,
+            "total_input": total_input,
+            "total_output": total_output,
+        }
+
+
+@dataclass(slots=True)
 class OrdinalTx(Tx):
     def get_inscription(self, conn: RawProxy) -> InscriptionContent | None:
         try:
-            witness_script = self.vin[0].txinwitness[1]
+            assert self.tapscript_hex, "no tapscript"
+            witness_script = self.tapscript_hex
 
             decoded_script = conn.decodescript(witness_script)["asm"]
 
@@ -230,13 +361,27 @@ class OrdinalTx(Tx):
 
             content_type = script_parts[6]
             content_type_ascii = bytes.fromhex(content_type).decode("ascii")
-            assert script_parts[7] == "0", "no 7"
+
+            # Other tag/value pairs until the body (tag 0)
+            parents = []
+            body_index = 7
+            assert body_index < len(script_parts) - 1, "no 7"
+            while script_parts[body_index] != "0":
+                assert script_parts[body_index] != "OP_ENDIF", "no 7"
+                # A tag without its value, the value must not be the OP_ENDIF
+                assert body_index + 1 < len(script_parts) - 1, "truncated tag"
+                tag = script_parts[body_index]
+                value = script_parts[body_index + 1]
+                if tag == "3" and len(value) >= 64:
+                    parents.append(inscription_id_from_push(value))
+                body_index += 2
 
             # cleanup
             if script_parts[-2] == "-2":
                 script_parts.pop(-2)
 
-            data_parts = script_parts[8:-1]
+            body_start = body_index + 1
+            data_parts = script_parts[body_start:-1]
             hex_data = "".join(data_parts)
 
             content_length = len(hex_data) // 2
@@ -248,15 +393,19 @@ class OrdinalTx(Tx):
                 data = witness_script[first_index:-2]
                 payload = bytes.fromhex(data)
 
+            INSCRIPTION_PARSES.inc(result="ok")
             return InscriptionContent(
                 content_length=content_length,
                 content_type=content_type_ascii,
                 content_hash=hashlib.md5(payload).hexdigest(),
                 payload=payload,
+                parents=parents,
             )
-        except AssertionError:
+        except AssertionError as e:
             # logger.error(f"AssertionError {self.tx_id} : {e}")
+            INSCRIPTION_PARSES.inc(result="not_inscription", reason=str(e))
             return None
         except Exception as e:
             logger.error(f"Exception {self.tx_id} : {e}")
+            INSCRIPTION_PARSES.inc(result="error", reason=type(e).__name__)
             return None
@@ -0,0 +1,248 @@
+"""Shared bus for the new/deleted inscription events.
+
+Lets several `app.py` workers run side by side - a single ingest process
+polls the pictures directory and publishes every event once, each worker
+subscribes and fans the events out to its own websocket clients.
+
+    python event_bus.py unix:///tmp/ordmempool.sock   # or redis://localhost:6379/0
+    ORDMEMPOOL_BUS=unix:///tmp/ordmempool.sock uvicorn app:app --workers 4 ...
+
+Without ORDMEMPOOL_BUS the app watches the directory itself, as before.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+from typing import AsyncIterator, Callable
+
+from watchdog.events import FileCreatedEvent, FileSystemEventHandler  # type: ignore
+from watchdog.observers.polling import PollingObserver  # type: ignore
+
+from logger import get_logger
+from serialization import JSONDecodeError, dumps, loads
+
+try:
+    import redis.asyncio as aioredis  # type: ignore
+except ImportError:
+    aioredis = None
+
+HERE = Path(__file__).parent
+
+log_file_path = HERE / "event_bus.log"
+logger = get_logger(__file__, log_file_path)
+
+BUS_URL = os.environ.get("ORDMEMPOOL_BUS", "")
+PICTURES_PATH = HERE / "static" / "pictures"
+
+REDIS_CHANNEL = "ordmempool_events"
+# new_tx events carry the whole tx metadata, which can be big
+MAX_EVENT_SIZE = 16 * 1024 * 1024
+SUBSCRIBER_SEND_TIMEOUT = 5  # seconds, slower subscribers get disconnected
+RECONNECT_INTERVAL = 1  # seconds
+
+
+def new_tx_event(json_file_path: str) -> dict:
+    data = loads(Path(json_file_path).read_bytes())
+    creation_time = os.path.getmtime(json_file_path)
+    # image has the same name as json file, so delete .json from the end
+    image = Path(json_file_path[: -len(".json")]).name
+    # clients expect a list
+    payload = [{"image": image, "data": data, "creation_time": creation_time}]
+    return {"type": "new_tx", "payload": payload}
+
+
+def tx_deleted_event(json_file_path: str) -> dict:
+    tx_id = Path(json_file_path).name.split(".")[0]
+    return {"type": "tx_deleted", "payload": tx_id}
+
+
+class PicturesDirHandler(FileSystemEventHandler):
+    """Turns file events into bus events, `on_event` is called from the observer thread."""
+
+    def __init__(self, on_event: Callable[[dict], None]) -> None:
+        super().__init__()
+        self.on_event = on_event
+
+    def on_created(self, event) -> None:
+        if event.is_directory or not event.src_path.endswith(".json"):
+            return
+        try:
+            bus_event = new_tx_event(event.src_path)
+        except Exception as e:
+            logger.exception(f"Exception new_tx_event - {event.src_path} - {e}")
+            return
+        self.on_event(bus_event)
+
+    def on_deleted(self, event) -> None:
+        if event.is_directory or not event.src_path.endswith(".json"):
+            return
+        self.on_event(tx_deleted_event(event.src_path))
+
+    def on_moved(self, event) -> None:
+        # rsync renames its temporary files into place, and the polling
+        # observer reports a reused inode as a move as well
+        if event.is_directory:
+            return
+        if event.src_path.endswith(".json"):
+            self.on_event(tx_deleted_event(event.src_path))
+        if event.dest_path.endswith(".json"):
+            self.on_created(FileCreatedEvent(event.dest_path))
+
+
+def watch_pictures_dir(
+    path: str | Path, on_event: Callable[[dict], None]
+) -> PollingObserver:
+    observer = PollingObserver()  # because rsync does not trigger events
+    observer.schedule(PicturesDirHandler(on_event), str(path), recursive=False)
+    observer.start()
+    return observer
+
+
+def _encode(event: dict) -> bytes:
+    return dumps(event) + b"\n"
+
+
+class UnixSocketBroker:
+    def __init__(self, socket_path: str) -> None:
+        self.socket_path = socket_path
+        self._subscribers: set[asyncio.StreamWriter] = set()
+
+    async def start(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        await asyncio.start_unix_server(self._on_subscriber, self.socket_path)
+        logger.info(f"Broker listening on {self.socket_path}")
+
+    async def _on_subscriber(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._subscribers.add(writer)
+        logger.info(f"Subscriber connected - {len(self._subscribers)} in total")
+        try:
+            # subscribers do not send anything, wait for them to go away
+            await reader.read()
+        finally:
+            self._subscribers.discard(writer)
+            writer.close()
+            logger.info(f"Subscriber gone - {len(self._subscribers)} in total")
+
+    async def _send(self, writer: asyncio.StreamWriter, line: bytes) -> None:
+        try:
+            writer.write(line)
+            await asyncio.wait_for(writer.drain(), SUBSCRIBER_SEND_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Dropping subscriber - {e}")
+            self._subscribers.discard(writer)
+            writer.close()
+
+    async def publish(self, event: dict) -> None:
+        line = _encode(event)
+        await asyncio.gather(*(self._send(w, line) for w in list(self._subscribers)))
+
+
+def _redis_client(bus_url: str):
+    if aioredis is None:
+        raise RuntimeError("Install the `redis` package to use a redis:// bus")
+    return aioredis.from_url(bus_url)
+
+
+async def _read_lines(reader: asyncio.StreamReader) -> AsyncIterator[bytes]:
+    """Lines until the connection closes, skipping those over MAX_EVENT_SIZE."""
+    oversized = False
+    while True:
+        try:
+            line = await reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError:
+            return
+        except asyncio.LimitOverrunError as e:
+            # Drop what is buffered, the rest of the line follows
+            await reader.readexactly(e.consumed)
+            oversized = True
+            continue
+        if oversized:
+            logger.error(f"Skipping an event over {MAX_EVENT_SIZE} bytes")
+            oversized = False
+            continue
+        yield line
+
+
+def _decode(data: bytes) -> dict | None:
+    try:
+        return loads(data)
+    except JSONDecodeError as e:
+        logger.error(f"Skipping an undecodable event - {e}")
+        return None
+
+
+async def subscribe(bus_url: str) -> AsyncIterator[dict]:
+    """Yields the published events forever, reconnecting when needed."""
+    if not bus_url.startswith(("unix://", "redis://")):
+        raise ValueError(f"Unsupported bus {bus_url}")
+    if bus_url.startswith("redis://"):
+        _redis_client(bus_url)  # fails now, not on every reconnect
+    while True:
+        # Anything going wrong must not end the generator - the web worker
+        # would stop broadcasting for good
+        try:
+            if bus_url.startswith("unix://"):
+                reader, writer = await asyncio.open_unix_connection(
+                    bus_url.removeprefix("unix://"), limit=MAX_EVENT_SIZE
+                )
+                logger.info(f"Subscribed to {bus_url}")
+                try:
+                    async for line in _read_lines(reader):
+                        if (event := _decode(line)) is not None:
+                            yield event
+                finally:
+                    writer.close()
+            else:
+                pubsub = _redis_client(bus_url).pubsub()
+                try:
+                    await pubsub.subscribe(REDIS_CHANNEL)
+                    logger.info(f"Subscribed to {bus_url}")
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        if (event := _decode(message["data"])) is not None:
+                            yield event
+                finally:
+                    await pubsub.reset()
+            logger.error(f"Bus {bus_url} closed the connection")
+        except Exception as e:
+            logger.error(f"Cannot subscribe to {bus_url} - {e!r}")
+        await asyncio.sleep(RECONNECT_INTERVAL)
+
+
+async def run_publisher(bus_url: str, pictures_dir: str | Path) -> None:
+    if bus_url.startswith("unix://"):
+        broker = UnixSocketBroker(bus_url.removeprefix("unix://"))
+        await broker.start()
+        publish = broker.publish
+    elif bus_url.startswith("redis://"):
+        client = _redis_client(bus_url)
+
+        async def publish(event: dict) -> None:
+            await client.publish(REDIS_CHANNEL, _encode(event))
+
+    else:
+        raise ValueError(f"Unsupported bus {bus_url}")
+
+    loop = asyncio.get_running_loop()
+
+    def on_event(event: dict) -> None:
+        asyncio.run_coroutine_threadsafe(publish(event), loop)
+
+    logger.info(f"Publishing events from {pictures_dir} to {bus_url}")
+    watch_pictures_dir(pictures_dir, on_event)
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    bus_url = sys.argv[1] if len(sys.argv) > 1 else BUS_URL
+    if not bus_url:
+        print("Usage: python event_bus.py <unix:///path/to/socket | redis://...>")
+        sys.exit(1)
+    asyncio.run(run_publisher(bus_url, PICTURES_PATH))
@@ -0,0 +1,264 @@
+"""Load test of the websocket fan-out in `app.py`.
+
+Opens many `/ws` connections to a running server, drops synthetic
+inscriptions into the watched pictures directory (and deletes them again)
+and measures how long it takes until every client gets notified.
+
+    uvicorn app:app --host 127.0.0.1 --port 9001
+    python load_test.py --clients 2000 --server-pid <uvicorn pid> --output run.json
+    python load_test.py ... --compare run.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import resource
+import time
+from pathlib import Path
+
+import websockets  # type: ignore
+
+HERE = Path(__file__).parent
+
+PICTURES_PATH = HERE / "static" / "pictures"
+# Each synthetic "image"
+PAYLOAD = b"\x89PNG\r\n\x1a\n" + b"\x00" * 1024
+CONNECT_CONCURRENCY = 200
+# How long to keep listening after the last event was triggered
+SETTLE_TIME = 10.0  # seconds
+
+
+def _percentiles(values: list[float]) -> dict[str, float | None]:
+    values = sorted(values)
+    result: dict[str, float | None] = {}
+    for p in (50, 90, 99, 100):
+        if not values:
+            result[f"p{p}"] = None
+        else:
+            result[f"p{p}"] = values[min(len(values) - 1, len(values) * p // 100)]
+    return result
+
+
+class ProcessSampler:
+    """CPU time and RSS of the server process, read from /proc."""
+
+    def __init__(self, pid: int | None) -> None:
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+
+    def cpu_seconds(self) -> float | None:
+        if self.pid is None:
+            return None
+        fields = Path(f"/proc/{self.pid}/stat").read_text().rsplit(")", 1)[1].split()
+        # utime and stime are the 14th and 15th fields of the whole line
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    def rss_bytes(self) -> int | None:
+        if self.pid is None:
+            return None
+        for line in Path(f"/proc/{self.pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+        return None
+
+
+class Client:
+    def __init__(self) -> None:
+        self.received: dict[str, float] = {}
+        self.deleted: dict[str, float] = {}
+
+    async def run(self, websocket) -> None:
+        async for message in websocket:
+            now = time.time()
+            result = json.loads(message)
+            if result.get("type") == "new_tx":
+                for item in result["payload"]:
+                    self.received[item["data"].get("tx_id", "")] = now
+            elif result.get("type") == "tx_deleted":
+                self.deleted[result["payload"]] = now
+
+
+async def connect_clients(
+    url: str, count: int
+) -> tuple[list[Client], list, list[asyncio.Task], int]:
+    semaphore = asyncio.Semaphore(CONNECT_CONCURRENCY)
+    clients: list[Client] = []
+    sockets = []
+    # the event loop only keeps weak references to tasks
+    tasks = []
+    failed = 0
+
+    async def connect() -> None:
+        nonlocal failed
+        async with semaphore:
+            try:
+                websocket = await websockets.connect(url, max_queue=None)
+            except Exception:
+                failed += 1
+                return
+        client = Client()
+        clients.append(client)
+        sockets.append(websocket)
+        tasks.append(asyncio.create_task(client.run(websocket)))
+
+    await asyncio.gather(*(connect() for _ in range(count)))
+    return clients, sockets, tasks, failed
+
+
+def write_inscription(pictures_dir: Path, tx_id: str) -> float:
+    image = pictures_dir / f"{tx_id}.png"
+    image.write_bytes(PAYLOAD)
+    data = {
+        "tx_id": tx_id,
+        "content_type": "image/png",
+        "content_length": len(PAYLOAD),
+        "fee_rate": 10.0,
+        "timestamp": int(time.time()),
+    }
+    sent = time.time()
+    (pictures_dir / f"{image.name}.json").write_text(json.dumps(data))
+    return sent
+
+
+def delete_inscription(pictures_dir: Path, tx_id: str) -> float:
+    deleted = time.time()
+    for file in pictures_dir.glob(f"{tx_id}*"):
+        file.unlink()
+    return deleted
+
+
+async def run_load_test(args: argparse.Namespace) -> dict:
+    sampler = ProcessSampler(args.server_pid)
+    pictures_dir = Path(args.pictures_dir)
+    rss_before = sampler.rss_bytes()
+
+    connect_start = time.time()
+    clients, sockets, _tasks, failed = await connect_clients(args.url, args.clients)
+    connect_time = time.time() - connect_start
+    await asyncio.sleep(1)
+    rss_connected = sampler.rss_bytes()
+    cpu_before = sampler.cpu_seconds()
+
+    run_id = f"{time.time()}"
+    sent: dict[str, float] = {}
+    deleted: dict[str, float] = {}
+    tx_ids = [
+        hashlib.sha256(f"load_test-{run_id}-{i}".encode()).hexdigest()
+        for i in range(args.arrivals)
+    ]
+    try:
+        for tx_id in tx_ids:
+            sent[tx_id] = write_inscription(pictures_dir, tx_id)
+            await asyncio.sleep(args.interval)
+        # the server polls the directory, so let it see the files first
+        await asyncio.sleep(SETTLE_TIME)
+        for tx_id in tx_ids:
+            deleted[tx_id] = delete_inscription(pictures_dir, tx_id)
+            await asyncio.sleep(args.interval)
+        await asyncio.sleep(SETTLE_TIME)
+    finally:
+        for tx_id in tx_ids:
+            delete_inscription(pictures_dir, tx_id)
+
+    cpu_after = sampler.cpu_seconds()
+    rss_after = sampler.rss_bytes()
+    for websocket in sockets:
+        await websocket.close()
+
+    new_latencies = []
+    deleted_latencies = []
+    dropped_new = dropped_deleted = 0
+    for client in clients:
+        for tx_id in tx_ids:
+            if tx_id in client.received:
+                new_latencies.append(client.received[tx_id] - sent[tx_id])
+            else:
+                dropped_new += 1
+            if tx_id in client.deleted:
+                deleted_latencies.append(client.deleted[tx_id] - deleted[tx_id])
+            else:
+                dropped_deleted += 1
+
+    connected = len(clients)
+    report = {
+        "url": args.url,
+        "clients": args.clients,
+        "connected": connected,
+        "failed_connections": failed,
+        "connect_seconds": connect_time,
+        "arrivals": args.arrivals,
+        "new_tx_latency": _percentiles(new_latencies),
+        "tx_deleted_latency": _percentiles(deleted_latencies),
+        "dropped_new_tx": dropped_new,
+        "dropped_tx_deleted": dropped_deleted,
+        "server_cpu_seconds": None,
+        "server_cpu_ms_per_connection": None,
+        "server_rss_bytes_per_connection": None,
+        "server_rss_bytes": rss_after,
+    }
+    if cpu_before is not None and cpu_after is not None and connected:
+        report["server_cpu_seconds"] = cpu_after - cpu_before
+        report["server_cpu_ms_per_connection"] = (
+            (cpu_after - cpu_before) * 1000 / connected
+        )
+    if rss_before is not None and rss_connected is not None and connected:
+        report["server_rss_bytes_per_connection"] = (
+            rss_connected - rss_before
+        ) / connected
+    return report
+
+
+def print_report(report: dict, previous: dict | None = None) -> None:
+    def line(name: str, value, old=None) -> None:
+        if isinstance(value, float):
+            text = f"{value:.4f}"
+        else:
+            text = str(value)
+        if isinstance(value, (int, float)) and isinstance(old, (int, float)):
+            text += f"  (was {old:.4f}, {value - old:+.4f})"
+        print(f"{name:<35} {text}")
+
+    previous = previous or {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                old = previous.get(key, {}).get(sub_key)
+                line(f"{key}.{sub_key}", sub_value, old)
+        else:
+            line(key, value, previous.get(key))
+
+
+def raise_open_files_limit() -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="ws://127.0.0.1:9001/ws")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--arrivals", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.1, help="seconds")
+    parser.add_argument("--pictures-dir", default=str(PICTURES_PATH))
+    parser.add_argument("--server-pid", type=int, help="for CPU and memory usage")
+    parser.add_argument("--output", help="save the report as JSON")
+    parser.add_argument("--compare", help="report of a previous run")
+    args = parser.parse_args()
+
+    raise_open_files_limit()
+    report = asyncio.run(run_load_test(args))
+    previous = None
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text())
+    print_report(report, previous)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=1))
+
+
+if __name__ == "__main__":
+    main()
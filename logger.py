@@ -1,14 +1,102 @@
 from __future__ import annotations
 
+import atexit
+import itertools
+import json
 import logging
+import logging.handlers
+import os
+import queue
 from pathlib import Path
 
+# Defaults, overridable from the environment
+LOG_ASYNC = os.environ.get("ORDMEMPOOL_LOG_ASYNC", "1") == "1"
+LOG_JSON = os.environ.get("ORDMEMPOOL_LOG_JSON", "") == "1"
+# Only every n-th record logged with `extra=SAMPLED` is kept
+LOG_SAMPLE_EVERY = int(os.environ.get("ORDMEMPOOL_LOG_SAMPLE_EVERY", 1))
+
+# Pass as `extra=` to per-tx lines that are fine to sample
+SAMPLED = {"sampled": True}
+
+_listeners: list[logging.handlers.QueueListener] = []
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, every: int) -> None:
+        super().__init__()
+        self.every = every
+        self._counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False):
+            return True
+        return next(self._counter) % self.every == 0
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": Path(record.name).stem,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data)
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    # The default implementation formats the message in the calling thread,
+    # we want to leave all the formatting to the listener thread.
+    # The queue never leaves the process, so the record can be passed as is.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _file_handler(log_file_path: str | Path) -> logging.Handler:
+    # Several processes append to the same files (common.log, app.log of all
+    # the workers, ...), so none of them can rotate - logrotate does it
+    # (see logrotate.conf), the handler reopens the file once it is moved
+    return logging.handlers.WatchedFileHandler(log_file_path)
+
+
+def _stop_listeners() -> None:
+    for listener in _listeners:
+        listener.stop()
+
+
+atexit.register(_stop_listeners)
+
+
+def get_logger(
+    name: str,
+    log_file_path: str | Path,
+    *,
+    use_queue: bool | None = None,
+    json_format: bool | None = None,
+    sample_every: int | None = None,
+) -> logging.Logger:
+    use_queue = LOG_ASYNC if use_queue is None else use_queue
+    json_format = LOG_JSON if json_format is None else json_format
+    sample_every = LOG_SAMPLE_EVERY if sample_every is None else sample_every
 
-def get_logger(name: str, log_file_path: str | Path) -> logging.Logger:
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
-    log_handler = logging.FileHandler(log_file_path)
-    log_formatter = logging.Formatter("%(asctime)s %(message)s")
+    log_handler = _file_handler(log_file_path)
+    if json_format:
+        log_formatter: logging.Formatter = JsonFormatter()
+    else:
+        log_formatter = logging.Formatter("%(asctime)s %(message)s")
     log_handler.setFormatter(log_formatter)
-    logger.addHandler(log_handler)
+    if sample_every > 1:
+        logger.addFilter(SamplingFilter(sample_every))
+    if use_queue:
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, log_handler)
+        listener.start()
+        _listeners.append(listener)
+        logger.addHandler(_LazyQueueHandler(log_queue))
+    else:
+        logger.addHandler(log_handler)
     return logger
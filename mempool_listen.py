@@ -1,11 +1,14 @@
+import os
 import sys
+import time
 from pathlib import Path
 from typing import Iterator
 
 import zmq
 
 from common import InscriptionContent, OrdinalTx, rpc_connection
-from logger import get_logger
+from logger import SAMPLED, get_logger
+from metrics import ZMQ_MESSAGES
 
 HERE = Path(__file__).parent
 
@@ -14,7 +17,7 @@ zmq_socket = zmq_context.socket(zmq.SUB)
 # zmq_topic = b"rawtx"
 # zmq_socket.connect("tcp://127.0.0.1:28332")
 zmq_topic = b"sequence"
-zmq_socket.connect("tcp://127.0.0.1:28333")
+zmq_socket.connect(os.environ.get("ORDMEMPOOL_ZMQ_SEQUENCE", "tcp://127.0.0.1:28333"))
 zmq_socket.setsockopt(zmq.SUBSCRIBE, zmq_topic)
 conn = rpc_connection()
 
@@ -25,10 +28,11 @@ logger = get_logger(__file__, log_file_path)
 def yield_new_tx_ids() -> Iterator[str]:
     while True:
         _topic, data, _seq_num = zmq_socket.recv_multipart()
+        ZMQ_MESSAGES.inc(topic="sequence")
         if len(data) == 41:
             tx_id = data[:32].hex()
             added_or_deleted = chr(data[32])  # "A" or "R"
-            logger.info(f"{tx_id} {added_or_deleted}")
+            logger.info("%s %s", tx_id, added_or_deleted, extra=SAMPLED)
             if added_or_deleted == "A":
                 yield tx_id
 
@@ -37,8 +41,10 @@ def yield_new_txs() -> Iterator[OrdinalTx]:
     new_tx_ids_iterator = yield_new_tx_ids()
     while True:
         tx_id = next(new_tx_ids_iterator)
+        seen_time = time.time()
         tx = OrdinalTx.from_tx_id(tx_id, conn)
         if tx is not None:
+            tx.seen_time = seen_time
             yield tx
         else:
             logger.warning(f"WARNING: tx is None. tx_id: {tx_id}")
@@ -1,22 +1,17 @@
-import json
 import sys
 import threading
 import time
-from decimal import Decimal
 from http.client import CannotSendRequest
 from pathlib import Path
 
 from common import InscriptionContent, OrdinalTx, RawProxy, rpc_connection
-from logger import get_logger
+from logger import SAMPLED, get_logger
 from mempool_listen import yield_new_txs
-
-
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return str(obj)
-        return super(DecimalEncoder, self).default(obj)
-
+from metrics import PROCESSING_IN_FLIGHT, start_metrics_server
+from moderation import get_moderator
+from reconcile import reconcile
+from serialization import dumps
+from storage import atomic_write, journal_entry
 
 HERE = Path(__file__).parent
 
@@ -25,8 +20,12 @@ logger = get_logger(__file__, log_file_path)
 
 data_dir = HERE / "static" / "pictures"
 
+METRICS_PORT = 9101
+
 ordinals_processed = 0
 
+moderator = get_moderator()
+
 conn = rpc_connection()
 
 
@@ -34,7 +33,7 @@ def main_listening():
     global conn
     for index, tx in enumerate(yield_new_txs()):
         if index % 100 == 0:
-            logger.info(f"index - {index} - {tx.tx_id}")
+            logger.info("index - %s - %s", index, tx.tx_id)
         exception_there = False
         while True:
             try:
@@ -60,58 +59,102 @@ def main_listening():
         processing_thread = threading.Thread(
             target=do_process_ordinal, args=(inscription, tx)
         )
-        logger.info(f"Starting processing_thread for {tx.tx_id}")
+        logger.info("Starting processing_thread for %s", tx.tx_id)
+        PROCESSING_IN_FLIGHT.inc()
         processing_thread.start()
 
 
 def do_process_ordinal(inscription: InscriptionContent, tx: OrdinalTx) -> None:
     global conn
     exception_there = False
-    while True:
-        try:
-            process_image_ordinal(inscription, tx, conn)
-            if exception_there:
-                logger.info(f"Recovered from error {tx.tx_id}")
-            break
-        except CannotSendRequest:
-            logger.error("Cannot send request")
-        except Exception as e:
-            logger.exception(f"Exception main_listening {e}")
-        conn = rpc_connection()
-        exception_there = True
-        time.sleep(1)
+    try:
+        while True:
+            try:
+                process_image_ordinal(inscription, tx, conn)
+                if exception_there:
+                    logger.info(f"Recovered from error {tx.tx_id}")
+                break
+            except CannotSendRequest:
+                logger.error("Cannot send request")
+            except Exception as e:
+                logger.exception(f"Exception main_listening {e}")
+            conn = rpc_connection()
+            exception_there = True
+            time.sleep(1)
+    finally:
+        PROCESSING_IN_FLIGHT.dec()
 
 
 def process_image_ordinal(
     inscription: InscriptionContent, tx: OrdinalTx, conn: RawProxy
 ) -> None:
-    logger.info(f"tx - {tx}")
-    logger.info(f"inscription - {inscription}")
+    logger.info("tx - %s", tx, extra=SAMPLED)
+    logger.info("inscription - %s", inscription)
     file_suffix = inscription.content_type.split("/")[-1]
     if file_suffix == "svg+xml":
         file_suffix = "svg"
     file_name = f"{tx.tx_id}.{file_suffix}"
     data_file = data_dir / file_name
     json_file = data_dir / f"{file_name}.json"
-    if not data_file.exists() or data_file.stat().st_size == 0:
-        with open(data_file, "wb") as f:
-            f.write(inscription.payload)
+    # Written last, so the entry is complete
+    if json_file.exists():
+        logger.info("Already stored - %s", data_file)
+        return
+    # Hashed in the background while the RPC calls below run
+    pending_verdict = moderator.submit(inscription) if moderator is not None else None
     data = tx.to_dict_without_witness(conn)
     data["content_type"] = inscription.content_type
     data["content_hash"] = inscription.content_hash
     data["content_length"] = inscription.content_length
+    data["parents"] = inscription.parents
     data["timestamp"] = int(time.time())
     data["datetime"] = time.strftime(
         "%Y-%m-%d %H:%M:%S UTC", time.gmtime(int(time.time()))
     )
-    if not json_file.exists() or json_file.stat().st_size == 0:
-        with open(json_file, "w") as f:
-            json.dump(data, f, indent=1, cls=DecimalEncoder)
-    logger.info(f"Files saved - {data_file}")
+    if moderator is not None and pending_verdict is not None:
+        verdict = moderator.verdict(pending_verdict)
+        if not verdict.allowed:
+            logger.info("Blocked by moderation - %s", tx.tx_id)
+            return
+        if verdict.image_hash is not None:
+            data["image_hash"] = f"{verdict.image_hash:016x}"
+    with journal_entry(tx.tx_id, tx.seen_time):
+        atomic_write(data_file, inscription.payload)
+        atomic_write(json_file, dumps(data))
+    logger.info("Files saved - %s", data_file)
+
+
+def process_again(to_process: dict[str, float]) -> None:
+    """Entries that were not completely written before the last exit."""
+    for tx_id, seen_time in to_process.items():
+        tx = OrdinalTx.from_tx_id(tx_id, conn)
+        if tx is None:
+            continue
+        tx.seen_time = seen_time
+        inscription = tx.get_inscription(conn)
+        if inscription is None or not inscription.content_type.startswith("image"):
+            continue
+        PROCESSING_IN_FLIGHT.inc()
+        do_process_ordinal(inscription, tx)
 
 
 if __name__ == "__main__":
+    logger.info("Reconciling with the mempool")
+    while True:
+        # The node could still be warming up, or not reachable yet
+        try:
+            process_again(reconcile(conn))
+            break
+        except KeyboardInterrupt:
+            logger.info("Stopping...")
+            sys.exit(0)
+        except Exception as e:
+            logger.exception(f"Exception {e}")
+            logger.info("Retrying the reconciliation...")
+            conn = rpc_connection()
+            time.sleep(1)
     logger.info("Starting main_listening")
+    start_metrics_server(METRICS_PORT)
     while True:
         try:
             main_listening()
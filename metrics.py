@@ -0,0 +1,207 @@
+"""Minimal Prometheus-style metrics.
+
+Disabled unless ORDMEMPOOL_METRICS=1 is set, in which case every
+`inc`/`set`/`observe` is a single attribute check and return.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_ENABLED = os.environ.get("ORDMEMPOOL_METRICS", "") == "1"
+
+# Latencies of RPC calls, websocket sends etc. - seconds
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry: list[_Metric] = []
+
+
+def _format_labels(labelnames: tuple[str, ...], labelvalues: tuple[str, ...]) -> str:
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, labelvalues):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(
+                    f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+                )
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+        # per label set: [count per bucket (+Inf last)], sum
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            if key not in self._counts:
+                self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            self._counts[key][index] += 1
+            self._sums[key] += value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        labelnames = self.labelnames + ("le",)
+        with self._lock:
+            for key, counts in self._counts.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else str(bound)
+                    labels = _format_labels(labelnames, key + (le,))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {self._sums[key]}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def start_metrics_server(port: int) -> None:
+    """Serve /metrics from a daemon thread, for the non-web processes."""
+    if not METRICS_ENABLED:
+        return
+    server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+
+# All the metrics live here, so importing several of our modules
+# into one process does not register anything twice.
+RPC_CALL_SECONDS = Histogram(
+    "ordmempool_rpc_call_seconds", "Bitcoin RPC call latency", ("method",)
+)
+RPC_ERRORS = Counter("ordmempool_rpc_errors_total", "Failed RPC calls", ("method",))
+ZMQ_MESSAGES = Counter(
+    "ordmempool_zmq_messages_total", "Received ZMQ messages", ("topic",)
+)
+INSCRIPTION_PARSES = Counter(
+    "ordmempool_inscription_parses_total",
+    "Results of OrdinalTx.get_inscription",
+    ("result", "reason"),
+)
+PROCESSING_IN_FLIGHT = Gauge(
+    "ordmempool_processing_in_flight", "Ordinals waiting for/in processing threads"
+)
+MODERATION_VERDICTS = Counter(
+    "ordmempool_moderation_verdicts_total",
+    "Moderation verdicts, by source (hash, cache, oversized, undecodable)",
+    ("verdict", "source"),
+)
+BLOCK_DELETED_TXS = Counter(
+    "ordmempool_block_deleted_txs_total", "Mempool ordinals removed after being mined"
+)
+WS_CLIENTS = Gauge("ordmempool_ws_clients", "Connected websocket clients")
+WS_SEND_SECONDS = Histogram(
+    "ordmempool_ws_send_seconds", "Websocket send latency", ("type",)
+)
@@ -0,0 +1,179 @@
+"""Optional moderation of the images before they are stored (and broadcast).
+
+Enabled by `ORDMEMPOOL_MODERATION=1`, needs `Pillow`. Every image gets a
+64-bit difference hash (dHash), which is looked up in the allowlist and the
+blocklist - `moderation/allowlist.txt` and `moderation/blocklist.txt`, one
+hash in hex per line. Images within `ORDMEMPOOL_MODERATION_DISTANCE` bits
+of a blocked hash are not stored, unless they are that close to an allowed
+one as well. Images too big to decode (`perceptual_hash.MAX_PIXELS`) are
+blocked and the ones Pillow cannot decode (e.g. SVG) are let through - set
+`ORDMEMPOOL_MODERATION_OVERSIZED` and `ORDMEMPOOL_MODERATION_UNDECODABLE`
+to `allow` or `block` to change that.
+
+Hashing runs in a pool of worker threads (Pillow releases the GIL while
+decoding and resizing), verdicts are cached by the SHA-256 of the payload
+(`content_hash` is MD5, so it can be collided) - from the submission on, so
+identical images minted at the same time are hashed once.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+from common import InscriptionContent
+from logger import get_logger
+from metrics import MODERATION_VERDICTS
+from perceptual_hash import BKTree, Image, TooBigToHash, dhash
+
+HERE = Path(__file__).parent
+
+log_file_path = HERE / "moderation.log"
+logger = get_logger(__file__, log_file_path)
+
+MODERATION_ENABLED = os.environ.get("ORDMEMPOOL_MODERATION", "") == "1"
+MODERATION_DIR = HERE / "moderation"
+MAX_DISTANCE = int(os.environ.get("ORDMEMPOOL_MODERATION_DISTANCE", "6"))
+WORKERS = int(os.environ.get("ORDMEMPOOL_MODERATION_WORKERS", "2"))
+POLICIES = ("allow", "block")
+OVERSIZED = os.environ.get("ORDMEMPOOL_MODERATION_OVERSIZED", "block")
+UNDECODABLE = os.environ.get("ORDMEMPOOL_MODERATION_UNDECODABLE", "allow")
+CACHE_SIZE = 10_000
+HASH_TIMEOUT = 10  # seconds
+
+
+def load_hashes(path: Path) -> list[int]:
+    if not path.exists():
+        return []
+    hashes = []
+    for line in path.read_text().splitlines():
+        line = line.split("#")[0].strip()
+        if line:
+            hashes.append(int(line, 16))
+    return hashes
+
+
+@dataclass(slots=True, frozen=True)
+class Verdict:
+    allowed: bool
+    image_hash: int | None = None
+
+    @property
+    def name(self) -> str:
+        return "allowed" if self.allowed else "blocked"
+
+
+class Moderator:
+    def __init__(
+        self,
+        blocklist: Iterable[int],
+        allowlist: Iterable[int],
+        workers: int = WORKERS,
+        max_distance: int = MAX_DISTANCE,
+        oversized: str = OVERSIZED,
+        undecodable: str = UNDECODABLE,
+    ) -> None:
+        for name, policy in (("oversized", oversized), ("undecodable", undecodable)):
+            if policy not in POLICIES:
+                raise ValueError(f"{name} must be one of {POLICIES}, not {policy!r}")
+        self.blocklist = BKTree(blocklist)
+        self.allowlist = BKTree(allowlist)
+        self.max_distance = max_distance
+        self.oversized = Verdict(oversized == "allow")
+        self.undecodable = Verdict(undecodable == "allow")
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="moderation")
+        # Keyed by the SHA-256 of the payload
+        self.cache: OrderedDict[bytes, Verdict | Future[Verdict]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_dir(cls, path: Path = MODERATION_DIR) -> Moderator:
+        moderator = cls(
+            load_hashes(path / "blocklist.txt"), load_hashes(path / "allowlist.txt")
+        )
+        logger.info(
+            f"Moderation with {moderator.blocklist.size} blocked and "
+            f"{moderator.allowlist.size} allowed hashes"
+        )
+        return moderator
+
+    def judge(self, image_hash: int) -> Verdict:
+        if self.allowlist.contains_near(image_hash, self.max_distance):
+            return Verdict(True, image_hash)
+        if self.blocklist.contains_near(image_hash, self.max_distance):
+            return Verdict(False, image_hash)
+        return Verdict(True, image_hash)
+
+    def submit(self, inscription: InscriptionContent) -> Future[Verdict]:
+        """Starts judging the image, so the caller can do other work meanwhile."""
+        key = hashlib.sha256(inscription.payload).digest()
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache.move_to_end(key)
+            else:
+                # Cached right away, so copies minted at the same time
+                # wait for this one instead of being hashed again
+                cached = self.pool.submit(
+                    self._hash_and_judge, key, inscription.payload
+                )
+                self.cache[key] = cached
+                if len(self.cache) > CACHE_SIZE:
+                    self.cache.popitem(last=False)
+                return cached
+        if isinstance(cached, Verdict):
+            MODERATION_VERDICTS.inc(verdict=cached.name, source="cache")
+            future: Future[Verdict] = Future()
+            future.set_result(cached)
+            return future
+        MODERATION_VERDICTS.inc(verdict="pending", source="cache")
+        return cached
+
+    def _hash_and_judge(self, key: bytes, payload: bytes) -> Verdict:
+        try:
+            verdict = self.judge(dhash(payload))
+            source = "hash"
+        except (TooBigToHash, Image.DecompressionBombError) as e:
+            logger.info(f"Too big to hash {key.hex()} - {e}")
+            verdict = self.oversized
+            source = "oversized"
+        except Exception as e:
+            # Not an image Pillow understands (e.g. SVG)
+            logger.info(f"Cannot hash {key.hex()} - {e!r}")
+            verdict = self.undecodable
+            source = "undecodable"
+        with self.lock:
+            # The future is not needed anymore, unless evicted meanwhile
+            if key in self.cache:
+                self.cache[key] = verdict
+        MODERATION_VERDICTS.inc(verdict=verdict.name, source=source)
+        return verdict
+
+    def verdict(self, future: Future[Verdict]) -> Verdict:
+        try:
+            return future.result(timeout=HASH_TIMEOUT)
+        except Exception as e:
+            logger.exception(f"Moderation failed, letting the image through - {e}")
+            return Verdict(True)
+
+
+def get_moderator() -> Moderator | None:
+    if not MODERATION_ENABLED:
+        return None
+    if Image is None:
+        logger.warning("ORDMEMPOOL_MODERATION is set, but Pillow is not installed")
+        return None
+    return Moderator.from_dir()
+
+
+if __name__ == "__main__":
+    # Prints the hashes of the given images, for the allowlist/blocklist
+    for file_name in sys.argv[1:]:
+        print(f"{dhash(Path(file_name).read_bytes()):016x}  # {Path(file_name).name}")
@@ -0,0 +1,87 @@
+"""Perceptual hashing of images, and an index to look hashes up by distance."""
+
+from __future__ import annotations
+
+from io import BytesIO
+from typing import Iterable
+
+try:
+    from PIL import Image  # type: ignore
+except ImportError:
+    Image = None
+
+
+# Payloads are attacker controlled - a tiny PNG can decode to a huge bitmap
+MAX_PIXELS = 2048 * 2048
+
+
+class TooBigToHash(ValueError):
+    pass
+
+
+def dhash(payload: bytes) -> int:
+    """Whether each pixel is brighter than its right neighbour, on a 9x8 greyscale."""
+    # Opening only reads the header, decoding happens on the first use
+    with Image.open(BytesIO(payload)) as image:
+        # Lets JPEGs decode at a fraction of their size
+        image.draft("L", (64, 64))
+        width, height = image.size
+        if width * height > MAX_PIXELS:
+            raise TooBigToHash(f"{width}x{height}")
+        # The first frame of animations
+        image.thumbnail((64, 64))
+        small = image.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    pixels = small.tobytes()
+    result = 0
+    for row in range(8):
+        for col in range(8):
+            index = row * 9 + col
+            result = (result << 1) | (pixels[index] > pixels[index + 1])
+    return result
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Finds hashes within a Hamming distance without comparing all of them."""
+
+    def __init__(self, hashes: Iterable[int] = ()) -> None:
+        # Node is (hash, {distance: child node})
+        self.root: tuple[int, dict] | None = None
+        self.size = 0
+        for value in hashes:
+            self.add(value)
+
+    def add(self, value: int) -> None:
+        if self.root is None:
+            self.root = (value, {})
+            self.size = 1
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (value, {})
+                self.size += 1
+                return
+            node = child
+
+    def contains_near(self, value: int, max_distance: int) -> bool:
+        if self.root is None:
+            return False
+        stack = [self.root]
+        while stack:
+            node_value, children = stack.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                return True
+            # Triangle inequality - only these subtrees can be close enough
+            for child_distance, child in children.items():
+                if abs(child_distance - distance) <= max_distance:
+                    stack.append(child)
+        return False
@@ -0,0 +1,134 @@
+"""Brings the pictures directory in line with the node's mempool.
+
+Runs when `mempool_ord.py` starts, as the listeners miss everything that
+happens while they are down - mined or replaced txs stay stored forever.
+Only there - the journal records are taken as left over from a crash, which
+they are not while `mempool_ord.py` is writing.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+
+from bitcoin.rpc import JSONRPCError, RawProxy
+
+from archive import ArchiveRecord, append_records
+from logger import get_logger
+from serialization import JSONDecodeError, loads
+from storage import PICS_DIR, is_complete, recover_journal, stored_entries
+
+HERE = Path(__file__).parent
+
+log_file_path = HERE / "reconcile.log"
+logger = get_logger(__file__, log_file_path)
+
+DELETE_BATCH_SIZE = 1000
+
+
+def load_metadata(files: list[os.DirEntry]) -> dict | None:
+    for file in files:
+        if file.name.endswith(".json"):
+            try:
+                return loads(Path(file.path).read_bytes())
+            except (OSError, JSONDecodeError):
+                return None
+    return None
+
+
+def first_seen(files: list[os.DirEntry]) -> float:
+    """From the metadata, the file times are only a fallback."""
+    data = load_metadata(files) or {}
+    return (
+        data.get("seen_time")
+        or data.get("timestamp")
+        or min(file.stat().st_mtime for file in files)
+    )
+
+
+def has_txindex(conn: RawProxy) -> bool:
+    try:
+        return conn.getindexinfo().get("txindex", {}).get("synced", False)
+    except JSONRPCError:
+        return False
+
+
+def archive_mined(
+    conn: RawProxy, entries: dict[str, list[os.DirEntry]], tx_ids: list[str]
+) -> int:
+    """Archives the entries mined while the listeners were down.
+
+    Needs `-txindex` to find their blocks, without it (and for the replaced
+    txs) the entries are deleted without an archive record.
+    """
+    if not tx_ids:
+        return 0
+    if not has_txindex(conn):
+        logger.warning(f"No txindex, not archiving {len(tx_ids)} gone entries")
+        return 0
+    heights: dict[str, tuple[int, float]] = {}
+    records = []
+    for tx_id in tx_ids:
+        data = load_metadata(entries[tx_id])
+        if data is None:
+            continue
+        try:
+            block_hash = conn.getrawtransaction(tx_id, True).get("blockhash")
+            if block_hash is None:
+                continue
+            if block_hash not in heights:
+                header = conn.getblockheader(block_hash)
+                heights[block_hash] = (header["height"], header["time"])
+        except JSONRPCError:
+            # Replaced by another tx
+            continue
+        # The block time stands in for its arrival, which nobody saw
+        block_height, mined_at = heights[block_hash]
+        try:
+            records.append(ArchiveRecord.from_metadata(data, block_height, mined_at))
+        except ValueError as e:
+            logger.error(f"Cannot archive {tx_id} - {e}")
+    return append_records(records)
+
+
+def reconcile(conn: RawProxy, pics_dir: Path = PICS_DIR) -> dict[str, float]:
+    """Deletes what is not in the mempool or was not completely written.
+
+    The mined entries are archived first, see `archive_mined`.
+
+    Returns the tx_ids (and seen times) of the incomplete entries that are
+    still in the mempool, so they can be processed again.
+    """
+    start = time.perf_counter()
+    interrupted = recover_journal(pics_dir)
+    entries = stored_entries(pics_dir)
+    mempool = set(conn.getrawmempool())
+
+    incomplete = {
+        tx_id: first_seen(files)
+        for tx_id, files in entries.items()
+        if not is_complete(files)
+    }
+    gone = sorted(entries.keys() - mempool - incomplete.keys())
+    archived = archive_mined(conn, entries, gone)
+    to_delete = sorted((entries.keys() - mempool) | incomplete.keys())
+    for index in range(0, len(to_delete), DELETE_BATCH_SIZE):
+        end = index + DELETE_BATCH_SIZE
+        batch = to_delete[index:end]
+        for tx_id in batch:
+            for file in entries[tx_id]:
+                Path(file.path).unlink(missing_ok=True)
+        logger.info(f"Deleted {index + len(batch)}/{len(to_delete)} entries")
+
+    to_process = {**incomplete, **interrupted}
+    to_process = {
+        tx_id: seen_time for tx_id, seen_time in to_process.items() if tx_id in mempool
+    }
+    logger.info(
+        f"Reconciled {len(entries)} stored entries with {len(mempool)} mempool txs "
+        f"in {time.perf_counter() - start:.2f} s - deleted {len(to_delete)}, "
+        f"archived {archived}, "
+        f"interrupted {len(interrupted)}, to process again {len(to_process)}"
+    )
+    return to_process
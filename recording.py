@@ -0,0 +1,183 @@
+"""Recording of ZMQ messages and RPC responses from a live node.
+
+The recording is a gzip stream of frames, each frame being
+`kind (1 byte) | timestamp (double) | length (uint32) | payload`:
+- ZMQ frames carry the multipart message (part count, then length-prefixed parts)
+- RPC frames carry JSON `{"method", "params", "result"}` or `{..., "error"}`
+
+`fake_bitcoind.py` replays it. Record by running against the real node:
+
+    python recording.py recording.bin.gz [seconds]
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import struct
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Iterator
+
+import zmq
+from bitcoin.rpc import JSONRPCError, RawProxy
+
+from common import OrdinalTx
+
+FRAME_ZMQ = 1
+FRAME_RPC = 2
+
+_HEADER = struct.Struct("<BdI")
+_PART_COUNT = struct.Struct("<H")
+_PART_LENGTH = struct.Struct("<I")
+
+# topic -> endpoint, as configured in bitcoin.conf of the node
+ZMQ_ENDPOINTS = {
+    b"rawtx": "tcp://127.0.0.1:28332",
+    b"sequence": "tcp://127.0.0.1:28333",
+    b"hashblock": "tcp://127.0.0.1:28334",
+}
+
+
+def _default(obj: Any) -> Any:
+    # Bitcoin amounts have at most 8 decimals, so the float repr
+    # gives back the same number when the replay parses it again
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Cannot serialize {type(obj)}")
+
+
+def encode_parts(parts: list[bytes]) -> bytes:
+    chunks = [_PART_COUNT.pack(len(parts))]
+    for part in parts:
+        chunks.append(_PART_LENGTH.pack(len(part)))
+        chunks.append(part)
+    return b"".join(chunks)
+
+
+def decode_parts(payload: bytes) -> list[bytes]:
+    (count,) = _PART_COUNT.unpack_from(payload, 0)
+    offset = _PART_COUNT.size
+    parts = []
+    for _ in range(count):
+        (length,) = _PART_LENGTH.unpack_from(payload, offset)
+        offset += _PART_LENGTH.size
+        end = offset + length
+        parts.append(payload[offset:end])
+        offset = end
+    return parts
+
+
+class RecordingWriter:
+    def __init__(self, path: str | Path) -> None:
+        self._file = gzip.open(path, "wb")
+
+    def _write(self, kind: int, payload: bytes, timestamp: float | None) -> None:
+        timestamp = time.time() if timestamp is None else timestamp
+        self._file.write(_HEADER.pack(kind, timestamp, len(payload)))
+        self._file.write(payload)
+
+    def write_zmq(self, parts: list[bytes], timestamp: float | None = None) -> None:
+        self._write(FRAME_ZMQ, encode_parts(parts), timestamp)
+
+    def write_rpc(
+        self,
+        method: str,
+        params: list | tuple,
+        result: Any = None,
+        error: dict | None = None,
+        timestamp: float | None = None,
+    ) -> None:
+        frame: dict[str, Any] = {"method": method, "params": list(params)}
+        if error is not None:
+            frame["error"] = error
+        else:
+            frame["result"] = result
+        payload = json.dumps(frame, default=_default, separators=(",", ":"))
+        self._write(FRAME_RPC, payload.encode(), timestamp)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def read_recording(path: str | Path) -> Iterator[tuple[int, float, Any]]:
+    """Yields (kind, timestamp, parts or rpc dict) in the recorded order."""
+    with gzip.open(path, "rb") as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            kind, timestamp, length = _HEADER.unpack(header)
+            payload = f.read(length)
+            if kind == FRAME_ZMQ:
+                yield kind, timestamp, decode_parts(payload)
+            elif kind == FRAME_RPC:
+                yield kind, timestamp, json.loads(payload)
+
+
+class RecordingRawProxy(RawProxy):
+    """Proxy saving every call and its response into the recording."""
+
+    def __init__(self, writer: RecordingWriter, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._writer = writer
+
+    def _call(self, service_name, *args):
+        try:
+            result = super()._call(service_name, *args)
+        except JSONRPCError as e:
+            self._writer.write_rpc(service_name, args, error=e.error)
+            raise
+        self._writer.write_rpc(service_name, args, result=result)
+        return result
+
+
+def record(path: str | Path, duration: float, conn: RawProxy | None = None) -> None:
+    """Captures the ZMQ feed for `duration` seconds.
+
+    Every added tx and new block is also walked through the same RPC calls
+    the pipeline makes, so the replay can answer them.
+    """
+    writer = RecordingWriter(path)
+    if conn is None:
+        conn = RecordingRawProxy(
+            writer, service_port=8332, btc_conf_file="mainnet.conf"
+        )
+    context = zmq.Context()
+    poller = zmq.Poller()
+    for topic, endpoint in ZMQ_ENDPOINTS.items():
+        socket = context.socket(zmq.SUB)
+        socket.connect(endpoint)
+        socket.setsockopt(zmq.SUBSCRIBE, topic)
+        poller.register(socket, zmq.POLLIN)
+
+    end = time.time() + duration
+    messages = 0
+    try:
+        while time.time() < end:
+            for socket, _event in poller.poll(timeout=100):
+                parts = socket.recv_multipart()
+                writer.write_zmq(parts)
+                messages += 1
+                topic, data = parts[0], parts[1]
+                try:
+                    if topic == b"sequence" and len(data) == 41 and data[32:33] == b"A":
+                        tx = OrdinalTx.from_tx_id(data[:32].hex(), conn)
+                        if tx is not None and tx.get_inscription(conn) is not None:
+                            tx.to_dict_without_witness(conn)
+                    elif topic == b"hashblock":
+                        conn.getblock(data.hex())
+                except Exception as e:
+                    print(f"Exception while recording {data.hex()}: {e}")
+    finally:
+        writer.close()
+    print(f"Recorded {messages} ZMQ messages into {path}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python recording.py <output_file> [seconds]")
+        sys.exit(1)
+    record(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else 600)
@@ -0,0 +1,43 @@
+"""JSON (de)serialization for the sidecar metadata, API and websockets.
+
+Uses `orjson` when it is installed, the standard library otherwise.
+The output is compact in both cases.
+"""
+
+from __future__ import annotations
+
+import json
+from decimal import Decimal
+from typing import Any
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
+JSONDecodeError = json.JSONDecodeError  # orjson's error subclasses it
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, bytes):
+        return obj.hex()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, default=_default, separators=(",", ":")).encode()
+
+
+def dumps_text(obj: Any) -> str:
+    """For websocket text frames."""
+    return dumps(obj).decode()
+
+
+def loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
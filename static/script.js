@@ -9,7 +9,8 @@ function shortenString(str, length) {const WS_URL = `wss://${window.location.hos
 }
 
 async function fetchInitialLatestImages() {
-    const response = await fetch('/api/latest-images');
+    // the same filter as the WebSocket subscription
+    const response = await fetch('/api/latest-images' + window.location.search);
     const results = await response.json();
     const size = results.size;
     updateMempoolSize(size);
@@ -47,7 +48,7 @@ function createCardFromResult(result) {
     card.setAttribute('tx_id', data.tx_id);
 
     const img = document.createElement('img');
-    img.src = `/static/pictures/${imagePath}`;
+    img.src = `/payload/${imagePath}`;
 
     let shortTxId = '';
     let mempoolSpaceLink = '';
@@ -113,11 +114,35 @@ function updateMempoolSize(newSize) {
 }
 
 
+// e.g. ?content_types=image/png,image/gif&min_fee_rate=10&max_size=100000&parents=<inscription id>
+function subscriptionFilterFromUrl() {
+    const params = new URLSearchParams(window.location.search);
+    const filter = {};
+    for (const name of ['content_types', 'parents']) {
+        if (params.get(name)) {
+            filter[name] = params.get(name).split(',');
+        }
+    }
+    for (const name of ['min_fee_rate', 'min_size', 'max_size']) {
+        if (params.get(name)) {
+            filter[name] = Number(params.get(name));
+        }
+    }
+    return filter;
+}
+
 function setupWebSocket() {
     const ws = new WebSocket(WS_URL);
 
     ws.addEventListener('open', (event) => {
         console.log('WebSocket connection opened:', event);
+        const filter = subscriptionFilterFromUrl();
+        if (Object.keys(filter).length > 0) {
+            // so we still hear about the already shown ones being mined
+            const cards = document.querySelectorAll('[tx_id]');
+            filter.tx_ids = Array.from(cards, (card) => card.getAttribute('tx_id'));
+            ws.send(JSON.stringify({ type: 'subscribe', filter: filter }));
+        }
     });
 
     ws.addEventListener('message', (event) => {
@@ -127,6 +152,11 @@ function setupWebSocket() {
             prependNewImages(results.payload);
         } else if (results.type === 'tx_deleted') {
             markTxAsDeleted(results.payload);
+        } else if (results.type === 'subscribed') {
+            return;
+        } else if (results.type === 'error') {
+            console.error('WebSocket subscription error:', results.message);
+            return;
         } else {
             console.error('Unknown WebSocket message type:', results.type);
         }
@@ -148,7 +178,8 @@ function setupWebSocket() {
     });
 }
 
-window.onload = () => {
-    fetchInitialLatestImages();
+window.onload = async () => {
+    // the shown tx_ids are part of the subscription
+    await fetchInitialLatestImages().catch((error) => console.error(error));
     setupWebSocket();
 };
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+
+DEFAULT_WINDOW = 60  # seconds
+DEFAULT_SAMPLE_SIZE = 2048
+PERCENTILES = (50, 90, 99)
+# Content types are chosen by whoever mints, beyond these go to "other"
+MAX_CONTENT_TYPES = 32
+OTHER_CONTENT_TYPE = "other"
+
+
+class RollingCounter:
+    """Sum of values seen in the last `window` seconds.
+
+    Uses a fixed ring of one-second buckets, so both adding and reading
+    are O(window) at worst and memory never grows.
+    """
+
+    def __init__(self, window: int = DEFAULT_WINDOW) -> None:
+        self.window = window
+        self._buckets = [0] * window
+        self._seconds = [0] * window
+
+    def add(self, amount: int = 1, now: float | None = None) -> None:
+        second = int(time.time() if now is None else now)
+        index = second % self.window
+        if self._seconds[index] != second:
+            self._seconds[index] = second
+            self._buckets[index] = 0
+        self._buckets[index] += amount
+
+    def total(self, now: float | None = None) -> int:
+        second = int(time.time() if now is None else now)
+        return sum(
+            value
+            for value, bucket_second in zip(self._buckets, self._seconds)
+            if second - bucket_second < self.window
+        )
+
+
+class RollingSample:
+    """Last `size` (timestamp, value) samples, percentiles over `window` seconds."""
+
+    def __init__(
+        self, window: int = DEFAULT_WINDOW, size: int = DEFAULT_SAMPLE_SIZE
+    ) -> None:
+        self.window = window
+        self._samples: deque[tuple[float, float]] = deque(maxlen=size)
+
+    def add(self, value: float, now: float | None = None) -> None:
+        self._samples.append((time.time() if now is None else now, value))
+
+    def percentiles(
+        self, percentiles: tuple[int, ...] = PERCENTILES, now: float | None = None
+    ) -> dict[str, float | None]:
+        since = (time.time() if now is None else now) - self.window
+        values = sorted(value for ts, value in self._samples if ts >= since)
+        result: dict[str, float | None] = {}
+        for p in percentiles:
+            if not values:
+                result[f"p{p}"] = None
+                continue
+            index = min(len(values) - 1, len(values) * p // 100)
+            result[f"p{p}"] = values[index]
+        return result
+
+
+class MempoolStats:
+    """In-memory statistics fed by new/deleted inscription events.
+
+    Nothing here ever touches the stored files - `size` is seeded once at
+    startup and then kept up to date from the events.
+    """
+
+    def __init__(self, window: int = DEFAULT_WINDOW) -> None:
+        self.window = window
+        self.size = 0
+        self.inscriptions = RollingCounter(window)
+        self.deletions = RollingCounter(window)
+        self.bytes_by_content_type: dict[str, RollingCounter] = {}
+        self.fee_rates = RollingSample(window)
+        self.latencies = RollingSample(window)
+        self._lock = threading.Lock()
+
+    def seed_size(self, size: int) -> None:
+        with self._lock:
+            self.size = size
+
+    def record_new(self, data: dict, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        content_type = data.get("content_type", "unknown")
+        with self._lock:
+            self.size += 1
+            self.inscriptions.add(1, now)
+            self._content_type_counter(content_type, now).add(
+                data.get("content_length", 0), now
+            )
+            if data.get("fee_rate") is not None:
+                self.fee_rates.add(data["fee_rate"], now)
+
+    def _content_type_counter(self, content_type: str, now: float) -> RollingCounter:
+        counters = self.bytes_by_content_type
+        if content_type in counters:
+            return counters[content_type]
+        if len(counters) >= MAX_CONTENT_TYPES:
+            # Making room by dropping the ones not seen within the window
+            for idle in [k for k, v in counters.items() if not v.total(now)]:
+                del counters[idle]
+        if len(counters) >= MAX_CONTENT_TYPES and content_type != OTHER_CONTENT_TYPE:
+            return self._content_type_counter(OTHER_CONTENT_TYPE, now)
+        counters[content_type] = RollingCounter(self.window)
+        return counters[content_type]
+
+    def record_deleted(self, now: float | None = None) -> None:
+        with self._lock:
+            self.size = max(0, self.size - 1)
+            self.deletions.add(1, now)
+
+    def record_broadcast(self, data: dict, now: float | None = None) -> None:
+        """Latency from ZMQ arrival in the listener to broadcast here."""
+        seen_time = data.get("seen_time")
+        if not seen_time:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            self.latencies.add(now - seen_time, now)
+
+    def to_dict(self, now: float | None = None) -> dict:
+        now = time.time() if now is None else now
+        with self._lock:
+            bytes_by_content_type = {
+                content_type: counter.total(now)
+                for content_type, counter in self.bytes_by_content_type.items()
+            }
+            return {
+                "window": self.window,
+                "size": self.size,
+                "inscriptions_per_minute": self.inscriptions.total(now)
+                * 60
+                / self.window,
+                "deletions_per_minute": self.deletions.total(now) * 60 / self.window,
+                "bytes_by_content_type": {
+                    k: v for k, v in bytes_by_content_type.items() if v
+                },
+                "fee_rate": self.fee_rates.percentiles(now=now),
+                "latency": self.latencies.percentiles(now=now),
+            }
@@ -0,0 +1,96 @@
+"""Crash-safe writes into the pictures directory.
+
+Files are written into a staging directory next to it, fsynced and renamed
+into place, so the directory watchers and rsync only ever see complete files.
+Every entry is recorded in a journal before its files are written and
+removed from it once they all are, so after a crash we know which entries
+to clean up (and process again).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from serialization import JSONDecodeError, dumps, loads
+
+HERE = Path(__file__).parent
+
+PICS_DIR = HERE / "static" / "pictures"
+# Has to be on the same filesystem as PICS_DIR for the renames to be atomic
+STAGING_DIR = HERE / "staging"
+JOURNAL_DIR = STAGING_DIR / "journal"
+
+
+def atomic_write(path: Path, content: bytes, fsync: bool = True) -> None:
+    STAGING_DIR.mkdir(parents=True, exist_ok=True)
+    # Several processing threads write at the same time
+    tmp_file = STAGING_DIR / f"{path.name}.{threading.get_ident()}.tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(content)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+@contextmanager
+def journal_entry(tx_id: str, seen_time: float) -> Iterator[None]:
+    """Everything written inside belongs to `tx_id`.
+
+    The journal record stays there when the block raises, the entry is
+    then cleaned up by `recover_journal` unless written again successfully.
+    """
+    JOURNAL_DIR.mkdir(parents=True, exist_ok=True)
+    record = JOURNAL_DIR / f"{tx_id}.json"
+    # Not synced - should a power loss take the record, the entry is missing
+    # its metadata or is empty, which the reconciliation catches as well
+    atomic_write(record, dumps({"tx_id": tx_id, "seen_time": seen_time}), fsync=False)
+    yield
+    record.unlink()
+
+
+def stored_entries(pics_dir: Path = PICS_DIR) -> dict[str, list[os.DirEntry]]:
+    """All files in the directory grouped by tx_id, in one scan."""
+    entries: dict[str, list[os.DirEntry]] = {}
+    with os.scandir(pics_dir) as it:
+        for file in it:
+            if file.is_file():
+                entries.setdefault(file.name.split(".")[0], []).append(file)
+    return entries
+
+
+def is_complete(files: list[os.DirEntry]) -> bool:
+    """Has the metadata and nothing is empty - leftovers of non-atomic writes."""
+    has_json = any(file.name.endswith(".json") for file in files)
+    return has_json and all(file.stat().st_size > 0 for file in files)
+
+
+def delete_entry(tx_id: str, pics_dir: Path = PICS_DIR) -> None:
+    for file in pics_dir.glob(f"{tx_id}*"):
+        file.unlink(missing_ok=True)
+
+
+def recover_journal(pics_dir: Path = PICS_DIR) -> dict[str, float]:
+    """Deletes the entries interrupted by a crash.
+
+    Returns their tx_ids with the time they were first seen.
+    """
+    if not STAGING_DIR.exists():
+        return {}
+    for tmp_file in STAGING_DIR.glob("*.tmp"):
+        tmp_file.unlink(missing_ok=True)
+
+    interrupted: dict[str, float] = {}
+    for record in JOURNAL_DIR.glob("*.json"):
+        tx_id = record.name.split(".")[0]
+        try:
+            interrupted[tx_id] = loads(record.read_bytes())["seen_time"]
+        except (OSError, JSONDecodeError, KeyError):
+            interrupted[tx_id] = record.stat().st_mtime
+        delete_entry(tx_id, pics_dir)
+        record.unlink()
+    return interrupted
@@ -0,0 +1,146 @@
+"""Per-client filters for the `/ws` feed.
+
+A client sends
+
+    {"type": "subscribe", "filter": {"content_types": ["image/png", "image/*"],
+     "min_fee_rate": 10, "min_size": 0, "max_size": 100000,
+     "parents": ["<inscription id>"], "tx_ids": ["<already shown tx_id>"]}}
+
+and from then on only gets the `new_tx` items matching all the given
+conditions, and `tx_deleted` for the txs it was sent (or listed in
+`tx_ids`). Without a filter it gets everything. The same filter applies to
+`/api/latest-images`, given as query parameters
+(`?content_types=image/png,image/webp&min_fee_rate=10`).
+"""
+
+from __future__ import annotations
+
+from typing import Callable, Mapping
+
+from serialization import dumps_text
+
+Predicate = Callable[[dict], bool]
+
+MAX_LIST_ITEMS = 100
+MAX_TX_IDS = 1000
+
+
+def _base_content_type(content_type: str) -> str:
+    # "text/plain;charset=utf-8" -> "text/plain"
+    return content_type.split(";")[0].strip().lower()
+
+
+def _string_list(spec: dict, name: str, max_items: int = MAX_LIST_ITEMS) -> list[str]:
+    values = spec.get(name) or []
+    if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+        raise ValueError(f"{name} must be a list of strings")
+    if len(values) > max_items:
+        raise ValueError(f"{name} can have at most {max_items} items")
+    return values
+
+
+def _number(spec: dict, name: str) -> float | None:
+    value = spec.get(name)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name} must be a number")
+    return value
+
+
+def compile_filter(spec: dict) -> tuple[dict, Predicate | None]:
+    """Validated filter and a predicate on the metadata, `None` matches everything."""
+    if not isinstance(spec, dict):
+        raise ValueError("filter must be an object")
+    normalized: dict = {}
+    checks: list[Predicate] = []
+
+    content_types = [_base_content_type(t) for t in _string_list(spec, "content_types")]
+    if content_types:
+        normalized["content_types"] = sorted(set(content_types))
+        exact = frozenset(t for t in content_types if not t.endswith("/*"))
+        prefixes = tuple(t[:-1] for t in content_types if t.endswith("/*"))
+
+        def content_type_check(data: dict) -> bool:
+            content_type = _base_content_type(data.get("content_type", ""))
+            return content_type in exact or content_type.startswith(prefixes)
+
+        checks.append(content_type_check)
+
+    min_fee_rate = _number(spec, "min_fee_rate")
+    if min_fee_rate is not None:
+        normalized["min_fee_rate"] = min_fee_rate
+        checks.append(lambda data: data.get("fee_rate", 0) >= min_fee_rate)
+
+    min_size = _number(spec, "min_size")
+    if min_size is not None:
+        normalized["min_size"] = min_size
+        checks.append(lambda data: data.get("content_length", 0) >= min_size)
+
+    max_size = _number(spec, "max_size")
+    if max_size is not None:
+        normalized["max_size"] = max_size
+        checks.append(lambda data: data.get("content_length", 0) <= max_size)
+
+    parents = frozenset(_string_list(spec, "parents"))
+    if parents:
+        normalized["parents"] = sorted(parents)
+        checks.append(lambda data: not parents.isdisjoint(data.get("parents", ())))
+
+    if not checks:
+        return normalized, None
+    if len(checks) == 1:
+        return normalized, checks[0]
+    return normalized, lambda data: all(check(data) for check in checks)
+
+
+def filter_from_query(params: Mapping[str, str]) -> dict:
+    """The filter given as URL query parameters, lists are comma-separated."""
+    spec: dict = {}
+    for name in ("content_types", "parents"):
+        if params.get(name):
+            spec[name] = params[name].split(",")
+    for name in ("min_fee_rate", "min_size", "max_size"):
+        if params.get(name):
+            try:
+                spec[name] = float(params[name])
+            except ValueError:
+                raise ValueError(f"{name} must be a number") from None
+    return spec
+
+
+class Subscription:
+    __slots__ = ("key", "matches", "sent_tx_ids")
+
+    def __init__(self) -> None:
+        # Clients with equal filters share the key, so one evaluation
+        # (and serialization) per event serves all of them
+        self.key = ""
+        self.matches: Predicate | None = None
+        self.sent_tx_ids: set[str] = set()
+
+    def update(self, spec: dict) -> dict:
+        normalized, matches = compile_filter(spec)
+        tx_ids = _string_list(spec, "tx_ids", MAX_TX_IDS)
+        self.key = dumps_text(normalized)
+        self.matches = matches
+        self.sent_tx_ids = set(tx_ids) if matches is not None else set()
+        return normalized
+
+    def select(self, items: list[dict]) -> list[dict]:
+        """The `new_tx` payload items the client is interested in."""
+        if self.matches is None:
+            return items
+        return [item for item in items if self.matches(item["data"])]
+
+    def remember(self, tx_ids: list[str]) -> None:
+        if self.matches is not None:
+            self.sent_tx_ids.update(tx_ids)
+
+    def wants_deleted(self, tx_id: str) -> bool:
+        if self.matches is None:
+            return True
+        if tx_id in self.sent_tx_ids:
+            self.sent_tx_ids.discard(tx_id)
+            return True
+        return False
@@ -7,9 +7,18 @@ REMOTE_SERVER="89.221.219.124"
 REMOTE_DIR="/home/jirka/ordmempool/static/pictures"
 # REMOTE_DIR="/home/jirka/ordmempool/trial"
 PORT="2020"
+# Written by blocks_listen.py, read by /api/history
+LOCAL_ARCHIVE_DIR="/home/pi/mempool_ord/archive"
+REMOTE_ARCHIVE_DIR="/home/jirka/ordmempool/archive"
 
-inotifywait -m -r -e create,modify,delete --format '%w%f' "${LOCAL_DIR}" | while read file
+mkdir -p "${LOCAL_ARCHIVE_DIR}"
+
+inotifywait -m -r -e create,modify,delete,moved_to --format '%w%f' "${LOCAL_DIR}" "${LOCAL_ARCHIVE_DIR}" | while read file
 do
   echo "Change detected in ${file}, syncing..."
-  rsync -avz -e "ssh -p ${PORT}" --delete "${LOCAL_DIR}/" "${REMOTE_USER}@${REMOTE_SERVER}:${REMOTE_DIR}/"
+  if [[ "${file}" == "${LOCAL_ARCHIVE_DIR}/"* ]]; then
+    rsync -avz -e "ssh -p ${PORT}" "${LOCAL_ARCHIVE_DIR}/" "${REMOTE_USER}@${REMOTE_SERVER}:${REMOTE_ARCHIVE_DIR}/"
+  else
+    rsync -avz -e "ssh -p ${PORT}" --delete "${LOCAL_DIR}/" "${REMOTE_USER}@${REMOTE_SERVER}:${REMOTE_DIR}/"
+  fi
 done
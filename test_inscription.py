@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import pytest
+
+import common
+from common import OrdinalTx
+
+PUBKEY = "ef" * 32
+CONTENT_TYPE = b"text/plain;charset=utf-8".hex()
+BODY = b"Hello, world!".hex()
+PARENT_TX_ID = bytes(range(32))
+
+
+class FakeConn:
+    """Only decodes the one script it was given the asm of."""
+
+    def __init__(self, asm: str) -> None:
+        self.asm = asm
+
+    def decodescript(self, script_hex: str) -> dict:
+        return {"asm": self.asm}
+
+
+def envelope(*fields: str) -> str:
+    return " ".join(
+        [PUBKEY, "OP_CHECKSIG", "0", "OP_IF", "6582895", "1", CONTENT_TYPE, *fields]
+        + ["OP_ENDIF"]
+    )
+
+
+def parse(asm: str) -> common.InscriptionContent | None:
+    tx = OrdinalTx(
+        tx_id="ab" * 32,
+        block=None,
+        size=0,
+        vsize=0,
+        vin=[],
+        vout=[],
+        tapscript_hex="01",
+    )
+    return tx.get_inscription(FakeConn(asm))
+
+
+@pytest.fixture
+def parses(monkeypatch: pytest.MonkeyPatch) -> list[dict]:
+    results: list[dict] = []
+
+    class Recorder:
+        def inc(self, amount: float = 1, **labels: str) -> None:
+            results.append(labels)
+
+    monkeypatch.setattr(common, "INSCRIPTION_PARSES", Recorder())
+    return results
+
+
+def test_plain(parses: list[dict]) -> None:
+    inscription = parse(envelope("0", BODY))
+    assert inscription is not None
+    assert inscription.content_type == "text/plain;charset=utf-8"
+    assert inscription.payload == b"Hello, world!"
+    assert inscription.content_length == 13
+    assert inscription.parents == []
+    assert parses == [{"result": "ok"}]
+
+
+def test_parent() -> None:
+    parent = (PARENT_TX_ID + b"\x01").hex()
+    inscription = parse(envelope("3", parent, "0", BODY))
+    assert inscription is not None
+    assert inscription.payload == b"Hello, world!"
+    assert inscription.parents == [f"{PARENT_TX_ID[::-1].hex()}i1"]
+
+
+def test_pointer() -> None:
+    inscription = parse(envelope("2", "1000", "0", BODY))
+    assert inscription is not None
+    assert inscription.payload == b"Hello, world!"
+    assert inscription.parents == []
+
+
+def test_empty_body() -> None:
+    inscription = parse(envelope("0"))
+    assert inscription is not None
+    assert inscription.payload == b""
+
+
+@pytest.mark.parametrize(
+    "fields, reason",
+    [
+        (("3",), "truncated tag"),
+        (("2", "1000"), "no 7"),
+        ((), "no 7"),
+    ],
+)
+def test_truncated(parses: list[dict], fields: tuple[str, ...], reason: str) -> None:
+    assert parse(envelope(*fields)) is None
+    assert parses == [{"result": "not_inscription", "reason": reason}]